@@ -1,40 +1,76 @@
-import pandas as pd
-from tabulate import tabulate
-import codecs
+import argparse
+import numpy as np
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from parquetStage import sources
 
-pd.options.display.max_columns =None
-pd.options.display.max_rows =40
+# Streaming extract of a random sample of accidents and their vehicles from the Parquet staging.
+# Only the sampled Accident_Index values are held in memory, the rows themselves are streamed
+# batch by batch, so memory doesn't grow with the size of the national files.
+#
+#   python csvExtract.py --sample-size 300000 --seed 42
 
-filename1 = 'Accident_Information.csv'
-with codecs.open(filename1, 'r', encoding='ISO-8859-1') as f:
-    df1 = pd.read_csv(f,low_memory=False)
-#df1 = pd.read_csv(filename1,low_memory=False)
 
-filename2 = 'Vehicle_Information.csv'
-with codecs.open(filename2, 'r', encoding='ISO-8859-1') as f:
-    df2 = pd.read_csv(f,low_memory=False)
-#df2 = pd.read_csv(filename2,low_memory=False)
+def staged_dataset(path):
+    return ds.dataset(path, format='parquet', partitioning='hive')
 
-dfAcc = df1.sample(n=300000)
-dfVeh = df2[df2['Accident_Index'].isin(dfAcc['Accident_Index'])]
-dfAcc1 = dfAcc[dfAcc['Accident_Index'].isin(dfVeh['Accident_Index'])]
 
-sorted_dfAcc = dfAcc1.sort_values(by='Accident_Index')
-sorted_dfVeh = dfVeh.sort_values(by='Accident_Index')
+def reservoir_sample(path, sample_size, seed, batch_size):
+    # Algorithm R over the Accident_Index column: the first sample_size keys fill the reservoir,
+    # after that the key at position p replaces a random slot with probability sample_size/(p+1).
+    # Each batch is handled with numpy, later rows win when two of them pick the same slot
+    rng = np.random.default_rng(seed)
+    reservoir = np.empty(sample_size, dtype=object)
+    seen = 0
 
-sorted_dfAcc.to_csv('Accidents_extract.csv', index=False)
-sorted_dfVeh.to_csv('Vehicles_extract.csv', index=False)
+    for batch in staged_dataset(path).to_batches(columns=['Accident_Index'], batch_size=batch_size):
+        keys = batch.column(0).to_numpy(zero_copy_only=False)
+        positions = np.arange(seen, seen + len(keys))
+        seen += len(keys)
 
-unique_count1 = dfAcc1['Accident_Index'].nunique()
-print(unique_count1)
+        fill = positions < sample_size
+        reservoir[positions[fill]] = keys[fill]
 
-unique_count2 = dfVeh['Accident_Index'].nunique()
-print(unique_count2)
+        slots = rng.integers(0, positions[~fill] + 1)
+        replace = slots < sample_size
+        slots, values = slots[replace][::-1], keys[~fill][replace][::-1]
+        slots, last = np.unique(slots, return_index=True)
+        reservoir[slots] = values[last]
 
-'''
-col_names1 = list(df1.columns)
-print(col_names1)
-'''
+    return set(reservoir[:min(seen, sample_size)])
 
 
-#print(tabulate(df, headers=col_names, tablefmt="psql", showindex="always"))
+def write_matching(path, out_file, accident_index, batch_size):
+    # One streaming pass that keeps the rows whose Accident_Index is in the sample and writes them
+    # straight to Parquet. Returns the Accident_Index values that matched
+    dataset = staged_dataset(path)
+    scanner = dataset.scanner(filter=ds.field('Accident_Index').isin(list(accident_index)), batch_size=batch_size)
+    matched = set()
+
+    with pq.ParquetWriter(out_file, scanner.projected_schema, compression='zstd') as writer:
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                writer.write_batch(batch)
+                matched.update(batch.column('Accident_Index').unique().to_pylist())
+    return matched
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sample accidents and their vehicles from the Parquet staging')
+    parser.add_argument('--sample-size', type=int, default=300000, help='number of accidents to sample')
+    parser.add_argument('--seed', type=int, default=42, help='random seed, the same seed gives the same extract')
+    parser.add_argument('--batch-size', type=int, default=100000, help='rows read per batch')
+    parser.add_argument('--accidents', default=sources['Accident_Information.csv'])
+    parser.add_argument('--vehicles', default=sources['Vehicle_Information.csv'])
+    parser.add_argument('--accidents-out', default='Accidents_extract.parquet')
+    parser.add_argument('--vehicles-out', default='Vehicles_extract.parquet')
+    args = parser.parse_args()
+
+    sample = reservoir_sample(args.accidents, args.sample_size, args.seed, args.batch_size)
+
+    # Vehicles of the sampled accidents, then only the sampled accidents that have vehicles
+    with_vehicles = write_matching(args.vehicles, args.vehicles_out, sample, args.batch_size)
+    extracted = write_matching(args.accidents, args.accidents_out, with_vehicles, args.batch_size)
+
+    print(len(extracted))
+    print(len(with_vehicles))
@@ -0,0 +1,79 @@
+import pandas as pd
+import codecs
+import os
+import sys
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# The column dtypes are shared with the loaders in ../python
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+from source_schema import ACCIDENT_SCHEMA, VEHICLE_SCHEMA
+
+# Parse the Kaggle CSVs once and keep them as typed, zstd compressed Parquet partitioned by Year.
+# csvExtract.py and the loaders read this staging with column projection instead of re-parsing the CSVs
+
+sources = {
+    'Accident_Information.csv': 'staging/Accident_Information',
+    'Vehicle_Information.csv': 'staging/Vehicle_Information'
+}
+
+schemas = {
+    'Accident_Information.csv': ACCIDENT_SCHEMA,
+    'Vehicle_Information.csv': VEHICLE_SCHEMA
+}
+
+
+# Rows parsed per chunk, the whole CSV is never held in memory at once
+CHUNK_ROWS = 200000
+
+# Parquet types of the schema dtypes. Categoricals are read as text and stored as dictionaries of strings
+# with a fixed index width, so every chunk writes the same schema whatever categories it happened to see
+ARROW_TYPES = {
+    'category': pa.dictionary(pa.int32(), pa.string()),
+    'object': pa.string(),
+    'string': pa.string(),
+    'Int8': pa.int8(),
+    'Int16': pa.int16(),
+    'Int32': pa.int32(),
+    'float64': pa.float64()
+}
+
+
+def stage_csv(filename, out_dir, schema, chunksize=CHUNK_ROWS):
+    # The CSV is parsed chunksize rows at a time and each chunk is streamed into the Year partitions.
+    # The nullable ints keep their width and the dictionaries come back as categoricals, so readers of
+    # the staging get the same compact dtypes
+    with codecs.open(filename, 'r', encoding='ISO-8859-1') as f:
+        columns = pd.read_csv(f, nrows=0).columns
+
+    # Any column the schema doesn't know about is stored as text
+    dtypes = {column: schema.get(column, 'string') for column in columns}
+    # The pandas metadata of an empty frame with the target dtypes makes to_pandas restore them
+    empty = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+    arrow_schema = pa.schema([(column, ARROW_TYPES[dtypes[column]]) for column in columns],
+                             metadata=pa.Schema.from_pandas(empty, preserve_index=False).metadata)
+    read_dtypes = {column: 'string' if dtype in ('category', 'object') else dtype for column, dtype in dtypes.items()}
+    rows = 0
+
+    def batches():
+        nonlocal rows
+        with codecs.open(filename, 'r', encoding='ISO-8859-1') as f:
+            for df in pd.read_csv(f, dtype=read_dtypes, chunksize=chunksize):
+                rows += len(df)
+                yield from pa.Table.from_pandas(df, preserve_index=False).cast(arrow_schema).to_batches()
+
+    ds.write_dataset(
+        batches(),
+        out_dir,
+        schema=arrow_schema,
+        format='parquet',
+        partitioning=ds.partitioning(pa.schema([arrow_schema.field('Year')]), flavor='hive'),
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+        existing_data_behavior='delete_matching'
+    )
+    return rows
+
+
+if __name__ == '__main__':
+    for filename, out_dir in sources.items():
+        print(f'{filename}: {stage_csv(filename, out_dir, schemas[filename])} rows staged to {out_dir}')
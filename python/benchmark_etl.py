@@ -0,0 +1,263 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, func, select
+
+from schema_ddl import create_schema, OLTP_INDEXES, DW_INDEXES
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module, peak RSS is reported as blank
+    resource = None
+
+# Benchmark for the OLTP loader and the warehouse pipes. Generates synthetic Accident/Vehicle CSVs
+# in the Kaggle extract layout, loads them into local SQLite databases and reports wall time,
+# rows/sec and peak RSS for every stage.
+#
+#   python benchmark_etl.py --rows 10000 100000 --mode bulk row
+
+
+# Synthetic data generator
+def pick_values(rng, values, size, missing=0.0):
+    # Random choice from a list of values, with a share of them left empty
+    out = rng.choice(np.array(values, dtype=object), size=size)
+    if missing:
+        out[rng.random(size) < missing] = None
+    return out
+
+
+def generate_accidents(rows, rng):
+    # Roughly one location per three accidents, so DimLocation is smaller than the fact
+    # table like in the real data
+    locations = max(rows // 3, 1)
+    location = rng.integers(0, locations, rows)
+    dates = pd.Timestamp('2005-01-01') + pd.to_timedelta(rng.integers(0, 365 * 12, rows), unit='D')
+    times = pd.to_timedelta(rng.integers(0, 24 * 60, rows), unit='m')
+
+    return pd.DataFrame({
+        'Accident_Index': [f'{2005 + i % 12}{i:09d}' for i in range(rows)],
+        '1st_Road_Class': pick_values(rng, ['A', 'B', 'C', 'Motorway', 'Unclassified', 'A(M)'], rows),
+        '1st_Road_Number': rng.integers(0, 1000, rows).astype(float),
+        '2nd_Road_Class': pick_values(rng, ['A', 'B', 'C', 'Unclassified'], rows, missing=0.4),
+        '2nd_Road_Number': rng.integers(0, 1000, rows).astype(float),
+        'Accident_Severity': pick_values(rng, ['Slight', 'Serious', 'Fatal'], rows),
+        'Carriageway_Hazards': pick_values(rng, ['None', 'Other object on road', 'Pedestrian in carriageway - not injured'],
+                                    rows, missing=0.02),
+        'Date': dates.strftime('%Y-%m-%d'),
+        'Day_of_Week': dates.day_name(),
+        'Did_Police_Officer_Attend_Scene_of_Accident': rng.integers(1, 3, rows).astype(float),
+        'Junction_Control': pick_values(rng, ['Give way or uncontrolled', 'Auto traffic signal', 'Stop sign',
+                                       'Data missing or out of range'], rows),
+        'Junction_Detail': pick_values(rng, ['T or staggered junction', 'Crossroads', 'Roundabout',
+                                      'Not at junction or within 20 metres'], rows),
+        'Latitude': np.round(49.9 + location * (10.0 / locations), 6),
+        'Light_Conditions': pick_values(rng, ['Daylight', 'Darkness - lights lit', 'Darkness - no lighting'], rows),
+        'Local_Authority_(District)': pick_values(rng, ['Westminster', 'Leeds', 'Birmingham', 'Glasgow City'], rows),
+        'Local_Authority_(Highway)': pick_values(rng, ['Westminster', 'Leeds', 'Birmingham', 'Glasgow City'], rows),
+        'Location_Easting_OSGR': rng.integers(100000, 650000, rows).astype(float),
+        'Location_Northing_OSGR': rng.integers(10000, 1200000, rows).astype(float),
+        'Longitude': np.round(-6.0 + (location * 7919 % locations) * (7.5 / locations), 6),
+        'LSOA_of_Accident_Location': pick_values(rng, ['E01000001', 'E01004736', 'W01001958'], rows, missing=0.07),
+        'Number_of_Casualties': rng.integers(1, 5, rows),
+        'Number_of_Vehicles': rng.integers(1, 4, rows),
+        'Pedestrian_Crossing-Human_Control': pick_values(rng, [0.0, 1.0, 2.0], rows, missing=0.01),
+        'Pedestrian_Crossing-Physical_Facilities': pick_values(rng, [0.0, 1.0, 5.0, 8.0], rows, missing=0.01),
+        'Police_Force': pick_values(rng, ['Metropolitan Police', 'West Yorkshire', 'Strathclyde'], rows),
+        'Road_Surface_Conditions': pick_values(rng, ['Dry', 'Wet or damp', 'Frost or ice', 'Snow'], rows, missing=0.01),
+        'Road_Type': pick_values(rng, ['Single carriageway', 'Dual carriageway', 'Roundabout', 'One way street'], rows),
+        'Special_Conditions_at_Site': pick_values(rng, ['None', 'Roadworks', 'Road surface defective'], rows, missing=0.02),
+        'Speed_limit': pick_values(rng, [20.0, 30.0, 40.0, 50.0, 60.0, 70.0], rows, missing=0.001),
+        'Time': (pd.Timestamp(0) + times).strftime('%H:%M').where(rng.random(rows) >= 0.001, None),
+        'Urban_or_Rural_Area': pick_values(rng, ['Urban', 'Rural'], rows),
+        'Weather_Conditions': pick_values(rng, ['Fine no high winds', 'Raining no high winds', 'Snowing no high winds',
+                                         'Fog or mist'], rows, missing=0.02),
+        'Year': dates.year,
+        'InScotland': pick_values(rng, ['No', 'Yes'], rows, missing=0.001),
+    })
+
+
+def generate_vehicles(accident_index, rows, rng):
+    return pd.DataFrame({
+        'Accident_Index': rng.choice(np.asarray(accident_index, dtype=object), size=rows),
+        'Age_Band_of_Driver': pick_values(rng, ['16 - 20', '26 - 35', '36 - 45', '66 - 75', 'Data missing or out of range'],
+                                   rows),
+        'Age_of_Vehicle': pick_values(rng, [1.0, 3.0, 7.0, 12.0, 20.0], rows, missing=0.15),
+        'Driver_Home_Area_Type': pick_values(rng, ['Urban area', 'Small town', 'Rural'], rows, missing=0.1),
+        'Driver_IMD_Decile': pick_values(rng, [float(d) for d in range(1, 11)], rows, missing=0.3),
+        'Engine_Capacity_.CC.': pick_values(rng, [998.0, 1242.0, 1598.0, 1968.0, 2993.0], rows, missing=0.1),
+        'Hit_Object_in_Carriageway': pick_values(rng, ['None', 'Kerb', 'Parked vehicle'], rows),
+        'Hit_Object_off_Carriageway': pick_values(rng, ['None', 'Tree', 'Lamp post'], rows),
+        'Journey_Purpose_of_Driver': pick_values(rng, ['Journey as part of work', 'Commuting to/from work', 'Other'], rows),
+        'Junction_Location': pick_values(rng, ['Not at or within 20 metres of junction', 'Mid Junction - on roundabout or on main road',
+                                        'Approaching junction or waiting/parked at junction approach'], rows),
+        'make': pick_values(rng, ['FORD', 'VAUXHALL', 'VOLKSWAGEN', 'TOYOTA', 'BMW'], rows, missing=0.05),
+        'model': pick_values(rng, ['FIESTA', 'ASTRA', 'GOLF', 'YARIS', '320D', 'FOCUS'], rows, missing=0.1),
+        'Propulsion_Code': pick_values(rng, ['Petrol', 'Heavy oil', 'Hybrid electric'], rows, missing=0.1),
+        'Sex_of_Driver': pick_values(rng, ['Male', 'Female', 'Not known'], rows),
+        'Skidding_and_Overturning': pick_values(rng, ['None', 'Skidded', 'Overturned'], rows),
+        'Towing_and_Articulation': pick_values(rng, ['No tow/articulation', 'Articulated vehicle'], rows),
+        'Vehicle_Leaving_Carriageway': pick_values(rng, ['Did not leave carriageway', 'Nearside'], rows),
+        'Vehicle_Location.Restricted_Lane': pick_values(rng, [0.0, 1.0, 2.0], rows, missing=0.01),
+        'Vehicle_Manoeuvre': pick_values(rng, ['Going ahead other', 'Turning right', 'Slowing or stopping'], rows),
+        'Vehicle_Reference': rng.integers(1, 4, rows),
+        'Vehicle_Type': pick_values(rng, ['Car', 'Motorcycle 125cc and under', 'Van / Goods 3.5 tonnes mgw or under',
+                                   'Pedal cycle'], rows),
+        'Was_Vehicle_Left_Hand_Drive': pick_values(rng, ['No', 'Yes'], rows, missing=0.01),
+        'X1st_Point_of_Impact': pick_values(rng, ['Front', 'Back', 'Offside', 'Nearside', 'Did not impact'], rows),
+        'Year': rng.integers(2005, 2017, rows),
+    })
+
+
+def write_synthetic_data(rows, out_dir, seed=0, vehicles_per_accident=1.8):
+    # Write Accidents_<rows>.csv and Vehicles_<rows>.csv and return their paths
+    rng = np.random.default_rng(seed)
+    accidents = generate_accidents(rows, rng)
+    vehicles = generate_vehicles(accidents['Accident_Index'], int(rows * vehicles_per_accident), rng)
+
+    accident_file = os.path.join(out_dir, f'Accidents_{rows}.csv')
+    vehicle_file = os.path.join(out_dir, f'Vehicles_{rows}.csv')
+    accidents.to_csv(accident_file, index=False)
+    vehicles.to_csv(vehicle_file, index=False)
+    return accident_file, vehicle_file, len(accidents) + len(vehicles)
+
+
+# Stage runners - each stage runs in a fresh process so the peak RSS belongs to that stage only
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def table_rows(connection_string, table):
+    engine = create_engine(connection_string)
+    try:
+        with engine.connect() as conn:
+            return conn.scalar(select(func.count()).select_from(table))
+    finally:
+        engine.dispose()
+
+
+def run_oltp_stage(conStrdb, accident_file, vehicle_file, source_rows, mode, chunksize):
+    import load_to_database
+
+    create_schema(create_engine(conStrdb), load_to_database.Base.metadata, OLTP_INDEXES)
+    loader = load_to_database.TrafficAccidentDataLoader(conStrdb, mode=mode)
+
+    start = time.perf_counter()
+    loader.load_data(accident_file, vehicle_file, chunksize=chunksize)
+    seconds = time.perf_counter() - start
+    loader.engine.dispose()
+    return source_rows, seconds, peak_rss_mb()
+
+
+def run_pipe_stage(conStrdb, conStrdw, pipe_name):
+    import load_to_data_warehouse as dw
+
+    create_schema(create_engine(conStrdw), dw.Base.metadata, DW_INDEXES)
+    pipe = getattr(dw, pipe_name)
+    table = PIPE_TABLES[pipe_name]
+
+    with dw.ETLContext(conStrdb, conStrdw, incremental=False) as ctx:
+        before = table_rows(conStrdw, dw.Base.metadata.tables[table])
+        start = time.perf_counter()
+        pipe(ctx)
+        seconds = time.perf_counter() - start
+        rows = table_rows(conStrdw, dw.Base.metadata.tables[table]) - before
+    return rows, seconds, peak_rss_mb()
+
+
+# Warehouse table each pipe loads, rows/sec counts the new rows in it. Listed in dependency order
+PIPE_TABLES = {
+    'pipe_Location': 'DimLocation',
+    'pipe_Condition': 'DimCondition',
+    'pipe_Road': 'DimRoad',
+    'pipe_Accident_Detail': 'DimAccidentDetail',
+    'pipe_Driver': 'DimDriver',
+    'pipe_Vehicle_Detail': 'DimVehicleDetail',
+    'pipe_Fact_Accident': 'FactAccident',
+    'pipe_Fact_Vehicle': 'FactVehicle',
+}
+
+
+def run_stage(function, *args):
+    # Spawn rather than fork so the child doesn't inherit the parent's memory
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+def run_benchmark(rows, mode, work_dir, seed=0, chunksize=None, warehouse=True):
+    results = []
+
+    def record(stage, stage_rows, seconds, peak_rss):
+        results.append({
+            'rows': rows,
+            'mode': mode,
+            'stage': stage,
+            'stage_rows': stage_rows,
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(stage_rows / seconds) if seconds else None,
+            'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+        })
+        print(results[-1])
+
+    accident_file, vehicle_file, source_rows = write_synthetic_data(rows, work_dir, seed)
+
+    # Fresh SQLite stand-ins for the OLTP database and the warehouse
+    oltp_db = os.path.join(work_dir, f'oltp_{rows}_{mode}.db')
+    dw_db = os.path.join(work_dir, f'dw_{rows}_{mode}.db')
+    for path in (oltp_db, dw_db):
+        if os.path.exists(path):
+            os.remove(path)
+    conStrdb = f'sqlite:///{oltp_db}'
+    conStrdw = f'sqlite:///{dw_db}'
+
+    record('load_to_database',
+           *run_stage(run_oltp_stage, conStrdb, accident_file, vehicle_file, source_rows, mode, chunksize))
+
+    if warehouse:
+        for pipe_name in PIPE_TABLES:
+            record(pipe_name, *run_stage(run_pipe_stage, conStrdb, conStrdw, pipe_name))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the OLTP loader and warehouse pipes on synthetic data')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000],
+                        help='accident rows to generate, one run per value (vehicles are 1.8x that)')
+    parser.add_argument('--mode', nargs='+', default=['bulk'], choices=['bulk', 'row'],
+                        help='OLTP load modes to compare')
+    parser.add_argument('--chunksize', type=int, default=None, help='stream the CSVs in chunks of this size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', default='benchmark_data', help='where the CSVs and SQLite files are written')
+    parser.add_argument('--no-warehouse', action='store_true', help='only benchmark the OLTP load')
+    parser.add_argument('--output', help='also write the results to this CSV file')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    os.makedirs(args.work_dir, exist_ok=True)
+    # The pipes log to DW_log.txt in the working directory, keep it with the benchmark files
+    os.chdir(args.work_dir)
+
+    results = []
+    for rows in args.rows:
+        for mode in args.mode:
+            results += run_benchmark(rows, mode, '.', args.seed, args.chunksize, not args.no_warehouse)
+
+    results = pd.DataFrame(results)
+    print()
+    print(results.to_string(index=False))
+    if output:
+        results.to_csv(output, index=False)
+
+
+if __name__ == '__main__':
+    main()
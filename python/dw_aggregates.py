@@ -0,0 +1,233 @@
+import datetime
+import operator
+from sqlalchemy import Table, Column, Integer, BigInteger, String, DateTime
+from sqlalchemy import select, insert, update, delete, exists, func, inspect
+from sqlalchemy.sql import table, column
+
+from etl_utils import stage_table, null_safe_match
+
+# Pre-aggregated summary tables over the warehouse facts. Each aggregate keeps the fact count and the
+# sums of the fact's additive measures at one grain of dimension attributes, so a dashboard query groups
+# a few hundred aggregate rows instead of joining and scanning the facts. refresh_aggregates runs at the
+# end of each fact pipe and only rolls up the facts added since the last refresh, route_query answers a
+# grouped query from the smallest up-to-date aggregate that has every column it needs, or from the facts.
+#
+#   route_query(engine, 'FactAccident', ['year'], where=[('urban_rural_area', '!=', 'Unallocated')])
+
+# fact table -> (surrogate key, additive measures)
+FACTS = {
+    'FactAccident': ('fact_accident_id', ['number_of_casualties', 'number_of_vehicles']),
+    'FactVehicle': ('fact_vehicle_id', [])
+}
+
+# Dimension attributes a fact can be grouped by: fact -> {attribute: (dimension, key column)}. The key
+# column has the same name in the fact and the dimension
+FACT_ATTRIBUTES = {
+    'FactAccident': {
+        'year': ('DimDate', 'date_key'),
+        'month': ('DimDate', 'date_key'),
+        'urban_rural_area': ('DimLocation', 'location_id'),
+        'road_class': ('DimRoad', 'road_id'),
+        'speed_limit': ('DimRoad', 'road_id'),
+        'weather_conditions': ('DimCondition', 'condition_id')
+    },
+    'FactVehicle': {
+        'make_name': ('DimVehicleDetail', 'vehicle_detail_id'),
+        'model_name': ('DimVehicleDetail', 'vehicle_detail_id'),
+        'vehicle_type': ('DimVehicleDetail', 'vehicle_detail_id'),
+        'age_band_of_driver': ('DimDriver', 'driver_id'),
+        'sex': ('DimDriver', 'driver_id')
+    }
+}
+
+# aggregate table -> (fact table, grain)
+AGGREGATES = {
+    'AggAccidentYearArea': ('FactAccident', ['year', 'urban_rural_area']),
+    'AggAccidentMonthRoadClass': ('FactAccident', ['year', 'month', 'road_class']),
+    'AggVehicleMakeModel': ('FactVehicle', ['make_name', 'model_name'])
+}
+
+COUNT_COLUMN = 'fact_count'
+
+# How far each aggregate is refreshed, the router only uses aggregates that are level with their fact
+STATE_TABLE = 'AggregateState'
+
+OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda column, values: column.in_(values)
+}
+
+
+def define_aggregates(metadata):
+    # Add the aggregate tables and the state table to the warehouse metadata, so create_all and
+    # schema_ddl create them with the rest of the schema. Grain columns take the type of their
+    # dimension column, so the dimensions must already be in metadata
+    for name, (fact, grain) in AGGREGATES.items():
+        if name in metadata.tables:
+            continue
+        attributes = FACT_ATTRIBUTES[fact]
+        Table(name, metadata,
+              Column('aggregate_id', Integer, primary_key=True, autoincrement=True),
+              *[Column(attribute, metadata.tables[attributes[attribute][0]].c[attribute].type) for attribute in grain],
+              *[Column(measure, BigInteger) for measure in measure_names(fact)])
+    if STATE_TABLE not in metadata.tables:
+        Table(STATE_TABLE, metadata,
+              Column('aggregate_name', String(100), primary_key=True),
+              Column('fact_table', String(100)),
+              Column('fact_id', BigInteger),      # facts up to this surrogate key are rolled up
+              Column('row_count', Integer),
+              Column('refreshed_at', DateTime))
+    return [metadata.tables[name] for name in [*AGGREGATES, STATE_TABLE]]
+
+
+def measure_names(fact):
+    return [COUNT_COLUMN, *FACTS[fact][1]]
+
+
+def state_table():
+    return table(STATE_TABLE, column('aggregate_name'), column('fact_table'), column('fact_id'),
+                 column('row_count'), column('refreshed_at'))
+
+
+def fact_source(fact, attributes):
+    # The fact joined to the dimensions that hold the given attributes. Returns the join, the fact
+    # table, attribute -> column and measure -> aggregate expression
+    key, measures = FACTS[fact]
+    dimensions = {}
+    for attribute in attributes:
+        dimensions.setdefault(FACT_ATTRIBUTES[fact][attribute], []).append(attribute)
+
+    fact_table = table(fact, column(key), *[column(measure) for measure in measures],
+                       *[column(dim_key) for _, dim_key in dimensions])
+    source = fact_table
+    attribute_columns = {}
+    for (dimension, dim_key), dim_attributes in dimensions.items():
+        dim_table = table(dimension, column(dim_key), *[column(attribute) for attribute in dim_attributes])
+        source = source.join(dim_table, fact_table.c[dim_key] == dim_table.c[dim_key])
+        attribute_columns.update({attribute: dim_table.c[attribute] for attribute in dim_attributes})
+
+    # Sums of all-NULL groups count as 0, like in the aggregates
+    measure_columns = {COUNT_COLUMN: func.count(),
+                       **{measure: func.coalesce(func.sum(fact_table.c[measure]), 0) for measure in measures}}
+    return source, fact_table, attribute_columns, measure_columns
+
+
+def aggregate_source(name):
+    # Same as fact_source for an aggregate table, whose measures are summed again
+    fact, grain = AGGREGATES[name]
+    aggregate = table(name, *[column(col) for col in grain + measure_names(fact)])
+    return (aggregate, {attribute: aggregate.c[attribute] for attribute in grain},
+            {measure: func.sum(aggregate.c[measure]) for measure in measure_names(fact)})
+
+
+def grouped_query(source, attribute_columns, measure_columns, group_by, measures, where=(), rollup=False,
+                  order_by=(), descending=False, limit=None, labels=None, rollup_label=None):
+    # SELECT the grouped attributes and measures FROM source, with the where filters applied before grouping
+    labels = labels or {}
+    expressions = {attribute: attribute_columns[attribute] for attribute in group_by}
+    if rollup and rollup_label is not None:
+        expressions = {attribute: func.coalesce(expression, rollup_label)
+                       for attribute, expression in expressions.items()}
+    expressions.update({measure: measure_columns[measure] for measure in measures})
+    columns = {name: expression.label(labels.get(name, name)) for name, expression in expressions.items()}
+    query = select(*columns.values()).select_from(source)
+    for attribute, op, value in where:
+        query = query.where(OPERATORS[op](attribute_columns[attribute], value))
+    if group_by:
+        grouping = [attribute_columns[attribute] for attribute in group_by]
+        query = query.group_by(func.rollup(*grouping)) if rollup else query.group_by(*grouping)
+    query = query.order_by(*[columns[name].desc() if descending else columns[name] for name in order_by])
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def pick_aggregate(conn, fact, attributes):
+    # Smallest aggregate of the fact whose grain has all the attributes and that is refreshed up to the
+    # fact's latest row, None when there isn't one
+    candidates = [name for name, (aggregate_fact, grain) in AGGREGATES.items()
+                  if aggregate_fact == fact and set(attributes) <= set(grain)]
+    if not candidates or not inspect(conn).has_table(STATE_TABLE):
+        return None
+    key = FACTS[fact][0]
+    latest = conn.scalar(select(func.max(table(fact, column(key)).c[key]))) or 0
+    state = state_table()
+    rows = conn.execute(select(state.c.aggregate_name, state.c.row_count)
+                        .where(state.c.aggregate_name.in_(candidates), state.c.fact_id == latest)).all()
+    return min(rows, key=lambda row: row.row_count).aggregate_name if rows else None
+
+
+def route_query(engine, fact, group_by, measures=(COUNT_COLUMN,), where=(), rollup=False, order_by=(),
+                descending=False, limit=None, labels=None, rollup_label=None):
+    # A grouped query over a fact, as a select on the smallest up-to-date aggregate that can answer it, or on
+    # the fact and its dimensions if none can. group_by and order_by are attribute/measure names, where is a
+    # list of (attribute, operator, value) filters, e.g. ('urban_rural_area', '!=', 'Unallocated'). labels
+    # renames result columns (name -> label), rollup_label fills the attributes of the rollup total rows
+    attributes = list(group_by) + [attribute for attribute, _, _ in where if attribute not in group_by]
+    with engine.connect() as conn:
+        name = pick_aggregate(conn, fact, attributes)
+    if name is None:
+        source, _, attribute_columns, measure_columns = fact_source(fact, attributes)
+    else:
+        source, attribute_columns, measure_columns = aggregate_source(name)
+    return grouped_query(source, attribute_columns, measure_columns, group_by, measures, where, rollup,
+                         order_by, descending, limit, labels, rollup_label)
+
+
+def refresh_aggregates(engine, metadata, fact):
+    # Roll the facts added since the last refresh up into every aggregate of the fact. Returns
+    # aggregate name -> number of facts rolled up
+    key = FACTS[fact][0]
+    with engine.connect() as conn:
+        latest = conn.scalar(select(func.max(metadata.tables[fact].c[key]))) or 0
+    return {name: refresh_aggregate(engine, metadata, name, latest)
+            for name, (aggregate_fact, _) in AGGREGATES.items() if aggregate_fact == fact}
+
+
+def refresh_aggregate(engine, metadata, name, latest):
+    # The new facts are grouped into the staging table on the server, then added to the aggregate rows
+    # of their grain (NULL matching NULL) and inserted for new grains, in one transaction with the state
+    fact, grain = AGGREGATES[name]
+    key = FACTS[fact][0]
+    measures = measure_names(fact)
+    aggregate = metadata.tables[name]
+    stage = stage_table(aggregate)
+    state = metadata.tables[STATE_TABLE]
+
+    source, fact_table, attribute_columns, measure_columns = fact_source(fact, grain)
+    delta = grouped_query(source, attribute_columns, measure_columns, grain, measures)
+
+    match = null_safe_match(aggregate, stage, grain)
+    totals = {measure: aggregate.c[measure] + select(stage.c[measure]).where(match).scalar_subquery()
+              for measure in measures}
+    new_rows = select(*[stage.c[col] for col in grain + measures]).where(~exists().where(match))
+
+    with engine.begin() as conn:
+        last = conn.scalar(select(state.c.fact_id).where(state.c.aggregate_name == name))
+        if last is not None and last >= latest:
+            return 0
+
+        stage.create(conn, checkfirst=True)
+        conn.execute(delete(stage))
+        conn.execute(insert(stage).from_select(grain + measures, delta.where(fact_table.c[key] > (last or 0),
+                                                                            fact_table.c[key] <= latest)))
+        rolled_up = conn.scalar(select(func.coalesce(func.sum(stage.c[COUNT_COLUMN]), 0)))
+        conn.execute(update(aggregate).where(exists().where(match)).values(totals))
+        conn.execute(insert(aggregate).from_select(grain + measures, new_rows))
+        conn.execute(delete(stage))
+
+        conn.execute(delete(state).where(state.c.aggregate_name == name))
+        conn.execute(insert(state).values(
+            aggregate_name=name,
+            fact_table=fact,
+            fact_id=latest,
+            row_count=conn.scalar(select(func.count()).select_from(aggregate)),
+            refreshed_at=datetime.datetime.now()
+        ))
+
+    return rolled_up
@@ -0,0 +1,105 @@
+import datetime
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+from sqlalchemy import event
+
+# Structured per-stage instrumentation for the OLTP loader and the warehouse pipes
+
+COUNTERS = ['rows_read', 'rows_inserted', 'rows_skipped', 'round_trips', 'bytes_fetched']
+
+
+class MetricsRegistry:
+    # Keeps one record per stage run in memory and, given a path, appends each finished record
+    # to a JSON-lines file. Counters go to the stage open on the current thread, so pipes running
+    # in parallel each count their own work
+    def __init__(self, path=None):
+        self.path = path
+        self.run_id = uuid.uuid4().hex[:12]
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name, **tags):
+        record = {'run_id': self.run_id, 'stage': name, **tags,
+                  'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                  'wall_seconds': None, 'status': 'running', **dict.fromkeys(COUNTERS, 0)}
+        previous = self.current()
+        self._local.record = record
+        start = time.perf_counter()
+        try:
+            yield record
+            record['status'] = 'ok'
+        except Exception:
+            record['status'] = 'failed'
+            raise
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - start, 4)
+            self._local.record = previous
+            self._finish(record)
+
+    @contextmanager
+    def bind(self, record):
+        # Count work done on a helper thread (e.g. a fact partition) against its parent stage
+        previous = self.current()
+        self._local.record = record
+        try:
+            yield record
+        finally:
+            self._local.record = previous
+
+    def current(self):
+        return getattr(self._local, 'record', None)
+
+    def add(self, **counts):
+        # Add to the counters of the current stage, outside a stage this does nothing. Stages can
+        # keep their own counters next to the standard ones
+        record = self.current()
+        if record is None:
+            return
+        with self._lock:
+            for key, value in counts.items():
+                record[key] = record.get(key, 0) + int(value)
+
+    def add_frame(self, df):
+        # Rows and in-memory bytes of an extracted frame
+        self.add(rows_read=len(df), bytes_fetched=df.memory_usage(deep=True).sum())
+
+    def watch_engine(self, engine):
+        # Every cursor execute is one round trip, an executemany batch counts once
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.add(round_trips=1)
+
+    def _finish(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+
+    def query(self, **filters):
+        # Finished stage records matching every filter, e.g. query(stage='pipe_Road', status='ok')
+        with self._lock:
+            return [dict(record) for record in self.records
+                    if all(record.get(key) == value for key, value in filters.items())]
+
+    def summary(self):
+        # One row per stage, slowest first
+        frame = pd.DataFrame(self.query())
+        if frame.empty:
+            return frame
+        frame = frame.groupby('stage', sort=False)[['wall_seconds'] + COUNTERS].sum()
+        frame['rows_per_sec'] = (frame['rows_inserted'] / frame['wall_seconds']).round()
+        return frame.sort_values('wall_seconds', ascending=False)
+
+
+def read_metrics(path):
+    # Load a JSON-lines metrics file back into a DataFrame
+    return pd.read_json(path, lines=True)
@@ -0,0 +1,184 @@
+import json
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, insert, select, and_, or_
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, DataError
+
+# Shared helpers for the bulk (set-at-a-time) load paths
+
+
+def engine_options(connection_string):
+    # pyodbc sends a whole parameter array in one round trip when fast_executemany is on,
+    # other drivers don't know the flag so only pass it to mssql+pyodbc
+    url = make_url(connection_string)
+    if url.get_backend_name() == 'mssql' and url.get_driver_name() == 'pyodbc':
+        return {'fast_executemany': True}
+    return {}
+
+
+def frame_to_records(df):
+    # Turn a DataFrame into a list of dicts ready for executemany, NaN/NA become None (NULL)
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def insert_batches(session, table, records, batch_size, on_reject=None):
+    # Write records with one executemany per batch instead of one INSERT per row. With on_reject
+    # every batch runs in its own savepoint, so a bad row only costs its batch instead of the
+    # whole transaction. Returns the records that were inserted, without the rejected ones
+    inserted = []
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        if on_reject is None:
+            session.execute(insert(table), batch)
+            inserted.extend(batch)
+        else:
+            inserted.extend(insert_isolated(session, table, batch, on_reject))
+    return inserted
+
+
+def insert_isolated(session, table, batch, on_reject):
+    # A failed batch is rolled back to its savepoint and split in half until the failing rows are
+    # found, each of those goes to on_reject(table, record, error) and the rest is inserted. Only errors
+    # a row can cause (constraint violations, bad values) are isolated, a lost connection, a deadlock or
+    # broken SQL fails the load
+    try:
+        with session.begin_nested():
+            session.execute(insert(table), batch)
+        return batch
+    except (IntegrityError, DataError) as error:
+        if len(batch) == 1:
+            on_reject(table, batch[0], error)
+            return []
+        middle = len(batch) // 2
+        return (insert_isolated(session, table, batch[:middle], on_reject) +
+                insert_isolated(session, table, batch[middle:], on_reject))
+
+
+# Staging tables for the set-based merges - stg_<table> has the table's columns minus its surrogate key.
+# Loads run in parallel, only one of them defines a given staging table
+stage_metadata = MetaData()
+stage_lock = threading.Lock()
+
+
+def stage_table(table):
+    name = 'stg_' + table.name
+    with stage_lock:
+        if name in stage_metadata.tables:
+            return stage_metadata.tables[name]
+        return Table(name, stage_metadata,
+                     *[Column(col.name, col.type) for col in table.columns if not col.primary_key])
+
+
+def null_safe_match(left, right, columns):
+    # The columns of left equal to the same columns of right, NULL matching NULL like filter_by(col=None) did
+    return and_(*[or_(left.c[col] == right.c[col], and_(left.c[col].is_(None), right.c[col].is_(None)))
+                  for col in columns])
+
+
+def null_safe_match_sql(left, right, columns):
+    # null_safe_match as SQL text over two table aliases, for the pushdown statements
+    return ' AND '.join(f"({left}.{col} = {right}.{col} OR ({left}.{col} IS NULL AND {right}.{col} IS NULL))"
+                        for col in columns)
+
+
+# Values per IN list when looking keys up, SQL Server takes at most 2100 parameters per statement
+KEY_BATCH_SIZE = 2000
+
+
+def existing_keys(session, column, values, columns=(), where=()):
+    # The distinct values that are already in column, one IN query per batch, so only the keys of the
+    # chunk being loaded are held in memory instead of every key in the table. With columns, the
+    # (value, *columns) tuples of the matching rows instead. where narrows down the rows searched
+    values = pd.Series(values).dropna().unique().tolist()
+    query = select(column, *columns).where(*where)
+    found = set()
+    for start in range(0, len(values), KEY_BATCH_SIZE):
+        batch = query.where(column.in_(values[start:start + KEY_BATCH_SIZE]))
+        found.update(map(tuple, session.execute(batch)) if columns else session.scalars(batch))
+    return found
+
+
+def reject_file(path):
+    # on_reject callback that appends each rejected row to a JSON-lines file with its table and error
+    lock = threading.Lock()
+
+    def write_reject(table, record, error):
+        reject = {'table': table.name, 'error': str(getattr(error, 'orig', None) or error), 'record': record}
+        with lock, open(path, 'a') as f:
+            f.write(json.dumps(reject, default=str) + '\n')
+
+    return write_reject
+
+
+# Column conversions, each one works on a whole Series. Missing values become the default (None if not given)
+def int_column(series, default=None):
+    values = np.trunc(pd.to_numeric(series, errors='coerce')).astype('Int64')
+    if default is not None:
+        values = values.fillna(default)
+    return values
+
+
+def float_column(series, default=None):
+    values = pd.to_numeric(series, errors='coerce').astype(float)
+    if default is not None:
+        values = values.fillna(default)
+    return values
+
+
+# Locations are keyed on their coordinates as fixed-point microdegrees packed into one int64, latitude
+# (+90) in the high bits and longitude (+180) in the low 29. The source carries six decimals, so equal
+# source coordinates always get the same key, and unlike the floats the key compares exactly and indexes well
+MICRODEGREES = 1000000
+LONGITUDE_BITS = 29
+
+
+def location_key(latitude, longitude):
+    # Int64 key for each latitude/longitude pair, missing if either coordinate is
+    latitude = np.round(float_column(latitude) * MICRODEGREES).astype('Int64') + 90 * MICRODEGREES
+    longitude = np.round(float_column(longitude) * MICRODEGREES).astype('Int64') + 180 * MICRODEGREES
+    return latitude * 2 ** LONGITUDE_BITS + longitude
+
+
+def str_column(series, default=None):
+    return series.astype(str).where(series.notna(), default)
+
+
+def key_column(series, default=None):
+    # Values kept as they are, so natural key columns can be used as dict keys
+    return series.astype(object).where(series.notna(), default)
+
+
+def code_column(series, default=None):
+    # Integer codes stored as text, 5.0 becomes '5'
+    values = int_column(series)
+    return values.astype(str).where(values.notna(), default)
+
+
+COLUMN_TYPES = {
+    'int': int_column,
+    'float': float_column,
+    'str': str_column,
+    'key': key_column,
+    'code': code_column
+}
+
+
+def map_columns(df, mapping):
+    # Build the target frame from a column mapping of (target, source, type, default) entries.
+    # Every column is converted in one vectorized call, a source column that isn't in the frame
+    # counts as all missing
+    columns = {}
+    for target, source, column_type, default in mapping:
+        series = df[source] if source in df else pd.Series(None, index=df.index, dtype=object)
+        columns[target] = COLUMN_TYPES[column_type](series, default)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def row_hash(df, columns):
+    # One signed 64-bit hash per row over the given columns, so a changed row is found with a single
+    # comparison instead of one per column. Values are hashed as text, so the same values hash the same
+    # whether a chunk came back as int, float or object
+    values = df[columns].astype('string')
+    return pd.Series(pd.util.hash_pandas_object(values, index=False).values.view('int64'), index=df.index)
@@ -1,10 +1,20 @@
 import pandas as pd
 import urllib
 import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 # Import important sqlalchemy classes
-from sqlalchemy import create_engine, Column, Integer, String, Date, Time, Float, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Date, Time, DateTime, Float, ForeignKey
+from sqlalchemy import insert, select, update, delete, exists, and_, or_, text, func, event, literal
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import DeclarativeBase, sessionmaker, relationship
 
+from etl_utils import engine_options, frame_to_records, insert_batches, map_columns, row_hash, existing_keys
+from etl_utils import stage_table, null_safe_match, null_safe_match_sql
+from etl_metrics import MetricsRegistry
+from dw_aggregates import define_aggregates, refresh_aggregates
+
 # Define connection strings
 # Edited connection strings for security
 conn_string_db = "Driver={ODBC Driver 17 for SQL Server};Server=your-server\\SQLEXPRESS;Database=Term_Project_Traffic_Accidents_OLTP;Trusted_Connection=yes;"
@@ -27,10 +37,10 @@ class DimDate(Base):
     date = Column(Date)
     year = Column(Integer)
     month = Column(Integer)
-    month_name = Column(String)
+    month_name = Column(String(10))
     week = Column(Integer)
     week_day = Column(Integer)
-    week_day_name = Column(String)
+    week_day_name = Column(String(10))
     day_number = Column(Integer)
 
 
@@ -39,46 +49,56 @@ class DimLocation(Base):
     location_id = Column(Integer, primary_key=True, autoincrement=True)
     location_easting_OSGR = Column(Integer)
     location_northing_OSGR = Column(Integer)
-    LSOA = Column(String)
+    LSOA = Column(String(255))
     latitude = Column(Float)
     longitude = Column(Float)
-    urban_rural_area = Column(String)
-    local_authority_district = Column(String)
-    local_authority_highway = Column(String)
-    in_Scotland = Column(String)
+    location_key = Column(BigInteger)   # natural key, same encoding as Location.location_key
+    urban_rural_area = Column(String(255))
+    local_authority_district = Column(String(255))
+    local_authority_highway = Column(String(255))
+    in_Scotland = Column(String(3))
+    # Type 2 history: a changed source row closes the current version and adds a new one
+    row_hash = Column(BigInteger)       # hash of the attribute columns, etl_utils.row_hash
+    effective_from = Column(DateTime)
+    effective_to = Column(DateTime)     # NULL while the version is current
+    is_current = Column(Integer)
 
 
 class DimCondition(Base):
     __tablename__ = 'DimCondition'
     condition_id = Column(Integer, primary_key=True, autoincrement=True)   # surrogate key
     src_condition_id = Column(Integer)   #natural key
-    weather_conditions = Column(String)
-    road_surface_conditions = Column(String)
-    light_conditions = Column(String)
-    carriageway_hazards = Column(String)
-    special_conditions = Column(String)
+    weather_conditions = Column(String(255))
+    road_surface_conditions = Column(String(255))
+    light_conditions = Column(String(255))
+    carriageway_hazards = Column(String(255))
+    special_conditions = Column(String(255))
 
 
 class DimRoad(Base):
     __tablename__ = 'DimRoad'
     road_id = Column(Integer, primary_key=True, autoincrement=True)   #SK
     src_road_id = Column(Integer)  #NK
-    road_class = Column(String)
+    road_class = Column(String(255))
     road_number = Column(Integer)
-    road_type = Column(String)
+    road_type = Column(String(255))
     speed_limit = Column(Integer)
-    junction_control = Column(String)
-    junction_detail = Column(String)
+    junction_control = Column(String(255))
+    junction_detail = Column(String(255))
+    row_hash = Column(BigInteger)       # Type 2 history, like DimLocation
+    effective_from = Column(DateTime)
+    effective_to = Column(DateTime)
+    is_current = Column(Integer)
 
 
 class DimAccidentDetail(Base):
     __tablename__ = 'DimAccidentDetail'
     accident_detail_id = Column(Integer, primary_key=True, autoincrement=True)
-    accident_index = Column(String)
+    accident_index = Column(String(255))
     police_attended = Column(Integer)
-    police_force = Column(String)
-    ped_crossing_human_control = Column(String)
-    ped_crossing_physical_facilities = Column(String)
+    police_force = Column(String(255))
+    ped_crossing_human_control = Column(String(255))
+    ped_crossing_physical_facilities = Column(String(255))
 
 
 class FactAccident(Base):
@@ -105,31 +125,39 @@ class DimDriver(Base):
     __tablename__ = "DimDriver"
     driver_id = Column(Integer, primary_key=True, autoincrement=True)
     src_driver_id = Column(Integer)
-    age_band_of_driver = Column(String)
-    driver_home_area_type = Column(String)
+    age_band_of_driver = Column(String(255))
+    driver_home_area_type = Column(String(255))
     driver_IMD_decile = Column(Integer)
-    sex = Column(String)
-    journey_purpose = Column(String)
+    sex = Column(String(255))
+    journey_purpose = Column(String(255))
+    row_hash = Column(BigInteger)       # Type 2 history, like DimLocation
+    effective_from = Column(DateTime)
+    effective_to = Column(DateTime)
+    is_current = Column(Integer)
 
 class DimVehicleDetail(Base):
     __tablename__ = "DimVehicleDetail"
     vehicle_detail_id = Column(Integer, primary_key=True, autoincrement=True)
     src_vehicle_id = Column(Integer)
-    make_name = Column(String)
-    model_name = Column(String)
-    propulsion_code = Column(String)
-    vehicle_type = Column(String)
-    skidding_and_overturning = Column(String)
-    towing_and_articulation = Column(String)
-    vehicle_leaving_carriageway = Column(String)
+    make_name = Column(String(255))
+    model_name = Column(String(255))
+    propulsion_code = Column(String(255))
+    vehicle_type = Column(String(255))
+    skidding_and_overturning = Column(String(255))
+    towing_and_articulation = Column(String(255))
+    vehicle_leaving_carriageway = Column(String(255))
     vehicle_location_restricted_lane = Column(Integer)
-    vehicle_manoeuvre = Column(String)
+    vehicle_manoeuvre = Column(String(255))
     vehicle_reference = Column(Integer)
-    vehicle_left_hand_drive = Column(String)
-    first_point_of_impact = Column(String)
-    hit_object_in_carriageway = Column(String)
-    hit_object_off_carriageway = Column(String)
-    vehicle_junction_location = Column(String)
+    vehicle_left_hand_drive = Column(String(255))
+    first_point_of_impact = Column(String(255))
+    hit_object_in_carriageway = Column(String(255))
+    hit_object_off_carriageway = Column(String(255))
+    vehicle_junction_location = Column(String(255))
+    row_hash = Column(BigInteger)       # Type 2 history, like DimLocation
+    effective_from = Column(DateTime)
+    effective_to = Column(DateTime)
+    is_current = Column(Integer)
 
 
 class FactVehicle(Base):
@@ -147,387 +175,844 @@ class FactVehicle(Base):
     vehicle_detail = relationship("DimVehicleDetail")
 
 
-# Date functions needed for DimDate and FactAccident
-def create_Date_Key(inDate):
-    in_Year = inDate.year
-    in_Month = inDate.strftime("%m")
-    in_DayNumber = inDate.strftime("%d")
-    out_Date_Key = int(str(in_Year) + str(in_Month) + str(in_DayNumber))
-    return out_Date_Key
-
-
-def addNew_Date(chkDate, conStrdw):
-    engine_dw = create_engine(conStrdw)
-
-    sqlQuery = 'SELECT * FROM DimDate'
-    dFrame = pd.read_sql_query(sqlQuery, engine_dw)
-
-    chk_Date = chkDate.strftime("%Y-%m-%d")
-    chk_Year = chkDate.year
-    chk_Month = chkDate.strftime("%m")
-    chk_MonthName = chkDate.strftime('%B')
-    chk_Week = int(chkDate.strftime('%U')) + 1
-    chk_WeekDay = chkDate.weekday() + 2
-    chk_WeekDayName = chkDate.strftime('%A')
-    chk_DayNumber = chkDate.strftime("%d")
-    chk_Date_Key = int(str(chk_Year) + str(chk_Month) + str(chk_DayNumber))
-
-    # Create a session
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-
-    # Check if the date key exists in the dataframe
-    if chk_Date_Key not in dFrame['date_key'].values:
-        # If primary key does not exist, create new record
-        new_record = DimDate(
-            date_key=chk_Date_Key,
-            date=chk_Date,
-            year=chk_Year,
-            month=chk_Month,
-            month_name=chk_MonthName,
-            week=chk_Week,
-            week_day=chk_WeekDay,
-            week_day_name=chk_WeekDayName,
-            day_number=chk_DayNumber
+# Dimensions that keep Type 2 history, the others only ever insert new natural keys
+SCD2_DIMENSIONS = [DimLocation, DimRoad, DimDriver, DimVehicleDetail]
+
+# Summary tables over the facts and their refresh state, see dw_aggregates
+AGGREGATE_TABLES = define_aggregates(Base.metadata)
+
+
+# Control table for incremental loads - the high-water mark of the source column each pipe extracts by
+class ETLWatermark(Base):
+    __tablename__ = 'ETLWatermark'
+    pipe_name = Column(String(100), primary_key=True)
+    source_table = Column(String(100))
+    watermark_column = Column(String(100))
+    watermark_value = Column(String(100))   # ids and dates are both kept as text
+    updated_at = Column(DateTime)
+
+
+# Control table for resumable runs - the state of each pipe in the current run, cleared once the run completes
+class ETLCheckpoint(Base):
+    __tablename__ = 'ETLCheckpoint'
+    pipe_name = Column(String(100), primary_key=True)
+    status = Column(String(20))             # 'running' or 'done'
+    updated_at = Column(DateTime)
+
+
+# Connection handling for a warehouse run
+class ETLContext:
+    # Owns one pooled engine per database for the whole run and is passed through every pipe,
+    # so connections are set up once per run instead of once per pipe (or per row)
+    def __init__(self, conStrdb, conStrdw, pool_size=5, max_overflow=10, pool_pre_ping=True, fact_partitions=4,
+                 incremental=True, metrics=None, checkpoint=True, lookup_max_rows=5000000, lookup_cache_size=500000,
+                 pushdown=False, chunksize=None, fetch_size=None, aggregates=True):
+        self.engine_db = create_engine(conStrdb, **self._engine_Options(conStrdb, pool_size, max_overflow,
+                                                                        pool_pre_ping))
+        self.engine_dw = create_engine(conStrdw, **self._engine_Options(conStrdw, pool_size, max_overflow,
+                                                                        pool_pre_ping))
+        self.Session_dw = sessionmaker(bind=self.engine_dw)
+
+        # Pushdown runs every pipe as INSERT ... SELECT on the DW connection, reading the OLTP tables
+        # through a cross-database name, so rows never leave the server. Only for two databases on the
+        # same SQL Server instance (or two SQLite files, the OLTP one attached to the DW connection)
+        self.pushdown = pushdown
+        self.source_prefix = self._source_Prefix(conStrdb, conStrdw) if pushdown else ''
+
+        # Per-pipe wall time, row counts and round trips, pass a MetricsRegistry with a path to also
+        # get them as JSON lines
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.metrics.watch_engine(self.engine_db)
+        self.metrics.watch_engine(self.engine_dw)
+
+        # Parallel pipes each hold a DW connection, SQLite only allows one writer at a time
+        self.max_workers = 1 if make_url(conStrdw).get_backend_name() == 'sqlite' else pool_size
+        # Number of independent partitions each fact load is split into
+        self.fact_partitions = fact_partitions
+        # Dimensions up to lookup_max_rows rows are held in memory whole while a fact pipe resolves its
+        # keys, bigger ones are queried for the keys a fact load needs through an LRU cache of this size
+        self.lookup_max_rows = lookup_max_rows
+        self.lookup_cache_size = lookup_cache_size
+
+        # Incremental runs only extract source rows past each pipe's watermark, a full run re-reads
+        # everything (the merges still skip what's already loaded)
+        self.incremental = incremental
+
+        # With a chunksize every pipe streams its extract from a server-side cursor and loads it chunk by
+        # chunk, so memory stays bounded by the chunk size instead of the source history. fetch_size is
+        # the number of rows the cursor buffers per round trip, the chunksize by default
+        self.chunksize = chunksize
+        self.fetch_size = fetch_size or chunksize
+        if incremental:
+            ETLWatermark.__table__.create(self.engine_dw, checkfirst=True)
+
+        # With checkpoints a rerun after a failed run skips the pipes that finished, and the fact pipes
+        # that were interrupted skip the partitions they already committed
+        self.checkpoint = checkpoint
+        if checkpoint:
+            ETLCheckpoint.__table__.create(self.engine_dw, checkfirst=True)
+
+        # With aggregates each fact pipe ends by rolling its new rows up into the summary tables
+        self.aggregates = aggregates
+        if aggregates:
+            for table in AGGREGATE_TABLES:
+                table.create(self.engine_dw, checkfirst=True)
+
+    def source_Table(self, table):
+        # Name of an OLTP table in the pipe queries, qualified with its database in pushdown mode
+        return self.source_prefix + table
+
+    def _source_Prefix(self, conStrdb, conStrdw):
+        url_db, url_dw = make_url(conStrdb), make_url(conStrdw)
+        if url_db.get_backend_name() == 'sqlite' and url_dw.get_backend_name() == 'sqlite':
+            event.listen(self.engine_dw, 'connect',
+                         lambda dbapi_conn, record: dbapi_conn.execute("ATTACH DATABASE ? AS oltp", (url_db.database,)))
+            return 'oltp.'
+        if url_db.get_backend_name() == 'mssql' and url_dw.get_backend_name() == 'mssql':
+            server_db, database_db = self._server_Database(url_db)
+            server_dw, _ = self._server_Database(url_dw)
+            if server_db == server_dw and database_db:
+                return f"[{database_db}].dbo."
+        raise ValueError("Pushdown needs the OLTP and DW databases on the same SQL Server instance")
+
+    @staticmethod
+    def _server_Database(url):
+        # Server and database of a URL, from its odbc_connect string if it has one
+        odbc = url.query.get('odbc_connect')
+        if odbc:
+            settings = dict(part.split('=', 1) for part in odbc.split(';') if '=' in part)
+            settings = {key.strip().lower(): value.strip() for key, value in settings.items()}
+            return settings.get('server', '').lower(), settings.get('database')
+        return f"{url.host}:{url.port}".lower(), url.database
+
+    @staticmethod
+    def _engine_Options(conStr, pool_size, max_overflow, pool_pre_ping):
+        # fast_executemany for pyodbc, pool sizing for server databases (SQLite picks its own pool)
+        options = engine_options(conStr)
+        options['pool_pre_ping'] = pool_pre_ping
+        if make_url(conStr).get_backend_name() != 'sqlite':
+            options['pool_size'] = pool_size
+            options['max_overflow'] = max_overflow
+        return options
+
+    def dispose(self):
+        self.engine_db.dispose()
+        self.engine_dw.dispose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
+
+
+BATCH_SIZE = 10000
+
+
+def merge_Dimension(engine_dw, dim_class, dFrame, natural_key):
+    # Stage the extracted frame in one bulk insert, then let the database decide which rows are new
+    # with a single INSERT ... SELECT ... WHERE NOT EXISTS keyed on the natural key
+    dim = dim_class.__table__
+    stage = stage_table(dim)
+    dFrame = dFrame.drop_duplicates(subset=natural_key)
+    columns = list(dFrame.columns)
+
+    # NULL keys match each other
+    match = null_safe_match(dim, stage, natural_key)
+    new_rows = select(*[stage.c[col] for col in columns]).where(~exists().where(match))
+
+    with engine_dw.begin() as conn:
+        stage.create(conn, checkfirst=True)
+        conn.execute(delete(stage))
+        insert_batches(conn, stage, frame_to_records(dFrame), BATCH_SIZE)
+        result = conn.execute(insert(dim).from_select(columns, new_rows))
+        conn.execute(delete(stage))
+
+    return result.rowcount
+
+
+def merge_Versioned(engine_dw, dim_class, dFrame, natural_key):
+    # Type 2 merge for the SCD2_DIMENSIONS. Each extracted row gets a hash of its attribute columns,
+    # so a change is one comparison per key against the current version. In one transaction over the
+    # staged frame: current versions without a hash (inserted by pushdown) take the staged one if every
+    # attribute is equal, current versions whose hash differs or is still missing are closed, and every
+    # key without a current version (new keys and the ones just closed) gets one. Returns (rows inserted,
+    # versions closed)
+    dim = dim_class.__table__
+    stage = stage_table(dim)
+    dFrame = dFrame.drop_duplicates(subset=natural_key)
+    attributes = [col for col in dFrame.columns if col not in natural_key]
+    dFrame = dFrame.assign(row_hash=row_hash(dFrame, attributes))
+    columns = list(dFrame.columns)
+    loaded_at = datetime.datetime.now()
+
+    match = and_(null_safe_match(dim, stage, natural_key), dim.c.is_current == 1)
+    same = null_safe_match(dim, stage, attributes)
+    adopt = (update(dim).where(dim.c.is_current == 1, dim.c.row_hash.is_(None), exists().where(match, same))
+             .values(row_hash=select(stage.c.row_hash).where(match).scalar_subquery()))
+    changed = or_(stage.c.row_hash != dim.c.row_hash, dim.c.row_hash.is_(None))
+    close = (update(dim).where(dim.c.is_current == 1, exists().where(match, changed))
+             .values(effective_to=loaded_at, is_current=0))
+    new_rows = (select(*[stage.c[col] for col in columns], literal(loaded_at), literal(1))
+                .where(~exists().where(match)))
+
+    with engine_dw.begin() as conn:
+        stage.create(conn, checkfirst=True)
+        conn.execute(delete(stage))
+        insert_batches(conn, stage, frame_to_records(dFrame), BATCH_SIZE)
+        conn.execute(adopt)
+        closed = conn.execute(close).rowcount
+        result = conn.execute(insert(dim).from_select(columns + ['effective_from', 'is_current'], new_rows))
+        conn.execute(delete(stage))
+
+    return result.rowcount, closed
+
+
+def load_Dimension(ctx, dim_class, sqlQuery, watermark_column, watermark, mapping, natural_key, inclusive=False):
+    # Extract, map and merge the new rows of one dimension. Returns the number of rows inserted
+    if ctx.pushdown:
+        return push_Dimension(ctx, dim_class, sqlQuery, watermark_column, watermark, mapping, natural_key, inclusive)
+
+    # Chunks are merged one after the other, the merge skips keys an earlier chunk inserted
+    counter = 0
+    for dFrame in read_Incremental(ctx, sqlQuery, watermark_column, watermark, inclusive):
+        dFrame = map_columns(dFrame, mapping)
+        if dim_class in SCD2_DIMENSIONS:
+            inserted, closed = merge_Versioned(ctx.engine_dw, dim_class, dFrame, natural_key)
+            ctx.metrics.add(rows_versioned=closed)
+        else:
+            inserted = merge_Dimension(ctx.engine_dw, dim_class, dFrame, natural_key)
+        ctx.metrics.add(rows_inserted=inserted, rows_skipped=len(dFrame) - inserted)
+        counter += inserted
+    return counter
+
+
+# Pushdown - the same extract, column mapping and merge as one statement run by the server
+def pushdown_Column(target, source, column_type, default):
+    # One column mapping entry as SQL over the source query, the types map_columns converts. The default
+    # is a bound parameter named after the target column, see pushdown_Defaults
+    expression = f"s.{source}"
+    if column_type == 'code':
+        expression = f"CAST({expression} AS VARCHAR(255))"
+    if default is not None:
+        expression = f"COALESCE({expression}, :default_{target})"
+    return expression
+
+
+def pushdown_Defaults(mapping):
+    # Parameters for the defaults pushdown_Column refers to
+    return {f"default_{target}": default for target, _, _, default in mapping if default is not None}
+
+
+def pushdown_Changed(table, columns):
+    # Any column of a dimension row different from the source row n, a NULL on one side only counts
+    return ' OR '.join(f"({table}.{column} <> n.{column} OR ({table}.{column} IS NULL AND n.{column} IS NOT NULL) "
+                       f"OR ({table}.{column} IS NOT NULL AND n.{column} IS NULL))" for column in columns)
+
+
+def push_Dimension(ctx, dim_class, sqlQuery, watermark_column, watermark, mapping, natural_key, inclusive=False):
+    # INSERT ... SELECT of the mapped source rows whose natural key isn't in the dimension yet,
+    # NULL keys match each other like in merge_Dimension. The SCD2_DIMENSIONS first close the current
+    # versions that differ from their source row - compared column by column, the pandas hash isn't
+    # there on the server, so their row_hash stays NULL until merge_Versioned adopts one
+    sqlQuery, params = incremental_Query(sqlQuery, watermark_column, watermark, inclusive)
+    dim = dim_class.__tablename__
+    versioned = dim_class in SCD2_DIMENSIONS
+    targets = ', '.join(target for target, _, _, _ in mapping)
+    params.update(pushdown_Defaults(mapping))
+    columns = ', '.join(f"{pushdown_Column(target, source, column_type, default)} AS {target}"
+                        for target, source, column_type, default in mapping)
+    source = f"(SELECT DISTINCT {columns} FROM ({sqlQuery}) s) n"
+    match = null_safe_match_sql('d', 'n', natural_key)
+
+    if versioned:
+        attributes = [target for target, _, _, _ in mapping if target not in natural_key]
+        sqlClose = (
+            f"UPDATE {dim} SET effective_to = :loaded_at, is_current = 0 "
+            f"WHERE is_current = 1 AND EXISTS (SELECT 1 FROM {source} "
+            f"WHERE {null_safe_match_sql(dim, 'n', natural_key)} AND ({pushdown_Changed(dim, attributes)}))"
+        )
+        sqlInsert = (
+            f"INSERT INTO {dim} ({targets}, effective_from, is_current) "
+            f"SELECT {targets}, :loaded_at, 1 FROM {source} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {dim} d WHERE {match} AND d.is_current = 1)"
         )
-        session.add(new_record)
+        params['loaded_at'] = datetime.datetime.now()
+    else:
+        sqlInsert = (
+            f"INSERT INTO {dim} ({targets}) "
+            f"SELECT {targets} FROM {source} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {dim} d WHERE {match})"
+        )
+
+    # Closing and inserting the new versions commit together
+    with ctx.engine_dw.begin() as conn:
+        if versioned:
+            ctx.metrics.add(rows_versioned=conn.execute(text(sqlClose), params).rowcount)
+        counter = conn.execute(text(sqlInsert), params).rowcount
+    ctx.metrics.add(rows_inserted=counter)
+    return counter
+
+
+def push_Statement(ctx, sqlInsert, watermark_column=None, watermark=None, inclusive=False, params=None):
+    # Run a pushdown INSERT on the DW connection. The fact statements end in a WHERE clause, their
+    # watermark filter is added to it
+    params = dict(params or {})
+    if watermark_column is not None and watermark is not None:
+        sqlInsert += f" AND {watermark_column} {'>=' if inclusive else '>'} :watermark"
+        params['watermark'] = watermark
+    with ctx.engine_dw.begin() as conn:
+        counter = conn.execute(text(sqlInsert), params).rowcount
+    ctx.metrics.add(rows_inserted=counter)
+    return counter
+
+
+def push_Unresolved(ctx, sqlSelect, watermark_column=None, watermark=None, inclusive=False):
+    # First watermark value of the source rows a pushdown fact INSERT left behind because a dimension row
+    # was missing, sqlSelect is a SELECT MIN(...) over the source rows without a fact that ends in a WHERE
+    # clause. None when every row got its fact
+    params = {}
+    if watermark_column is not None and watermark is not None:
+        sqlSelect += f" AND {watermark_column} {'>=' if inclusive else '>'} :watermark"
+        params['watermark'] = watermark
+    with ctx.engine_dw.connect() as conn:
+        return conn.scalar(text(sqlSelect), params)
+
+
+# Fact loads are split into partitions that are resolved and inserted independently
+def load_Partitions(ctx, dFrame, key_column, load_partition):
+    # Partition by a hash of the key column so each partition is independent, then give each one
+    # its own worker and DW session. Returns the number of rows inserted across all partitions
+    partition = pd.util.hash_pandas_object(dFrame[key_column], index=False).values % ctx.fact_partitions
+    parts = [dFrame[partition == number] for number in range(ctx.fact_partitions)]
+
+    # Partition threads count their queries against the calling pipe
+    record = ctx.metrics.current()
+    with ThreadPoolExecutor(max_workers=min(ctx.fact_partitions, ctx.max_workers)) as executor:
+        counts = list(executor.map(lambda part: run_Partition(ctx, part, load_partition, record), parts))
+    return sum(counts)
+
+
+def run_Partition(ctx, dFrame, load_partition, record=None):
+    # Each partition commits on its own
+    with ctx.metrics.bind(record):
+        session = ctx.Session_dw()
+        try:
+            counter = load_partition(dFrame, session)
+            session.commit()
+            return counter
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+# Surrogate key resolution for the fact pipes
+class KeyResolver:
+    # Natural key -> surrogate key for one dimension, where the lowest surrogate key wins like the
+    # .first() lookups did. A dimension that fits is read into memory once and a whole column of
+    # fact keys is resolved with one map, a bigger one is queried in batches for the keys that
+    # aren't in the LRU cache yet. Dimensions with Type 2 history resolve to their current versions
+    def __init__(self, ctx, dim_class, natural_key):
+        table = dim_class.__table__
+        self.engine = ctx.engine_dw
+        self.natural_key = table.c[natural_key]
+        self.surrogate_key = list(table.primary_key)[0]
+        self.current = [table.c.is_current == 1] if dim_class in SCD2_DIMENSIONS else []
+        self.cache_size = ctx.lookup_cache_size
+        self.cache = OrderedDict()
+        self.key_map = None
+
+        with self.engine.connect() as conn:
+            rows = conn.scalar(select(func.count()).select_from(table).where(*self.current))
+            if rows <= ctx.lookup_max_rows:
+                keys = pd.read_sql(select(self.natural_key, self.surrogate_key).where(*self.current)
+                                   .order_by(self.surrogate_key), conn)
+                keys = keys.drop_duplicates(subset=natural_key)
+                self.key_map = pd.Series(keys[self.surrogate_key.name].values, index=keys[natural_key].values)
+                ctx.metrics.add(bytes_fetched=keys.memory_usage(deep=True).sum())
+
+    def resolve(self, keys):
+        # Surrogate key for every value in keys (Int64, missing where the dimension has no row)
+        if self.key_map is not None:
+            return keys.map(self.key_map).astype('Int64')
+
+        found = {}
+        missing = []
+        for key in pd.unique(keys.dropna()).tolist():
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                found[key] = self.cache[key]
+            else:
+                missing.append(key)
+
+        # Batched IN queries for the keys the cache doesn't have, etl_utils.existing_keys
+        rows = {}
+        with self.engine.connect() as conn:
+            for key, surrogate in existing_keys(conn, self.natural_key, missing, [self.surrogate_key], self.current):
+                rows[key] = min(surrogate, rows.get(key, surrogate))
+        for key in missing:
+            found[key] = rows.get(key)
+            self._remember(key, found[key])
+
+        return keys.map(found).astype('Int64')
+
+    def _remember(self, key, value):
+        # Keys without a dimension row are cached too, as None
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+
+def key_Resolvers(ctx, lookups):
+    # One resolver per (target column, source column, dimension, natural key) lookup, built once per
+    # pipe and used for every chunk of its extract
+    return [(target, source, dim_class, KeyResolver(ctx, dim_class, natural_key))
+            for target, source, dim_class, natural_key in lookups]
+
+
+def resolve_Keys(dFrame, resolvers):
+    # Swap the natural keys of a fact extract for surrogate keys, one vectorized lookup per dimension.
+    # Rows missing any dimension are dropped
+    dFrame = dFrame.copy()
+    resolved = pd.Series(True, index=dFrame.index)
+    for target, source, dim_class, resolver in resolvers:
+        dFrame[target] = resolver.resolve(dFrame[source])
+        missing = dFrame[target].isna() & resolved
+        if missing.any():
+            print(f"No {dim_class.__tablename__} record found for {int(missing.sum())} rows")
+        resolved &= ~missing
+    return dFrame[resolved]
+
+
+def loaded_Facts(ctx, natural_key, surrogate_key, fact_key, keys):
+    # The natural keys of a fact chunk that already have a fact row, looked up for the chunk's keys only
+    # (etl_utils.existing_keys), so a full run doesn't read every loaded key into memory
+    with ctx.engine_dw.connect() as conn:
+        return existing_keys(conn, natural_key, keys, where=[exists().where(fact_key == surrogate_key)])
+
+
+def first_Unresolved(dFrame, resolved, column, first=None):
+    # Lowest value of column among the rows resolve_Keys dropped, or first if that is lower
+    dropped = dFrame.loc[~dFrame.index.isin(resolved.index), column].dropna()
+    values = [value for value in (first, dropped.min() if len(dropped) else None) if value is not None]
+    return min(values) if values else None
+
+
+def capped_Watermark(new_watermark, unresolved, inclusive=False):
+    # A fact pipe's watermark must not pass facts that were left behind for a missing dimension row, or
+    # they are never extracted again. Inclusive (date) watermarks stop on the first such value, exclusive
+    # (id) watermarks just before it, the facts that did load before it are skipped on the next run
+    if unresolved is None or new_watermark is None:
+        return new_watermark
+    if not inclusive:
+        unresolved -= 1
+    capped = min(new_watermark, unresolved, key=pd.Timestamp if inclusive else None)
+    if capped != new_watermark:
+        print(f"Watermark held back at {capped}, some rows have no dimension record yet")
+    return capped
+
+
+log_lock = threading.Lock()
+
+
+# Watermark functions for incremental extraction
+def get_Watermark(ctx, pipe_name):
+    # Last high-water mark saved by the pipe, None for a full load
+    if not ctx.incremental:
+        return None
+    with ctx.engine_dw.connect() as conn:
+        watermark = conn.scalar(select(ETLWatermark.watermark_value).where(ETLWatermark.pipe_name == pipe_name))
+    # Ids go back to integers so they compare as numbers
+    if watermark is not None and watermark.isdigit():
+        return int(watermark)
+    return watermark
+
+
+def save_Watermark(ctx, pipe_name, source_table, watermark_column, value):
+    # Only called once a pipe's rows are committed - an empty extract keeps the old watermark
+    if not ctx.incremental or value is None or pd.isna(value):
+        return
+    session = ctx.Session_dw()
+    try:
+        session.merge(ETLWatermark(
+            pipe_name=pipe_name,
+            source_table=source_table,
+            watermark_column=watermark_column,
+            watermark_value=str(value),
+            updated_at=datetime.datetime.now()
+        ))
+        session.commit()
+    finally:
+        session.close()
+
+
+def incremental_Query(sqlQuery, watermark_column, watermark, inclusive=False):
+    # Add the watermark filter to a source query that has no WHERE clause yet. Dates use an inclusive
+    # filter so rows added later on the last loaded day aren't missed
+    params = {}
+    if watermark is not None:
+        sqlQuery += f" WHERE {watermark_column} {'>=' if inclusive else '>'} :watermark"
+        params['watermark'] = watermark
+    return sqlQuery, params
+
+
+def read_Incremental(ctx, sqlQuery, watermark_column, watermark, inclusive=False):
+    # The extract as frames: one frame, or with ctx.chunksize one chunk at a time from a server-side
+    # cursor, so the next chunk is only fetched once the caller has loaded the previous one
+    sqlQuery, params = incremental_Query(sqlQuery, watermark_column, watermark, inclusive)
+    if ctx.chunksize is None:
+        dFrame = pd.read_sql_query(text(sqlQuery), ctx.engine_db, params=params)
+        ctx.metrics.add_frame(dFrame)
+        yield dFrame
+        return
+
+    with ctx.engine_db.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=ctx.fetch_size)
+        for dFrame in pd.read_sql_query(text(sqlQuery), conn, params=params, chunksize=ctx.chunksize):
+            ctx.metrics.add_frame(dFrame)
+            yield dFrame
+
+
+def source_Max(ctx, table, column):
+    # Watermark for pipes whose extract doesn't carry the watermark column, read before extracting
+    with ctx.engine_db.connect() as conn:
+        return conn.scalar(text(f"SELECT MAX({column}) FROM {table}"))
+
+
+# Checkpoint functions for resuming a failed run
+def get_Checkpoints(ctx):
+    # pipe_name -> status left behind by an unfinished run
+    with ctx.engine_dw.connect() as conn:
+        return dict(conn.execute(select(ETLCheckpoint.pipe_name, ETLCheckpoint.status)).all())
+
+
+def save_Checkpoint(ctx, pipe_name, status):
+    session = ctx.Session_dw()
+    try:
+        session.merge(ETLCheckpoint(pipe_name=pipe_name, status=status, updated_at=datetime.datetime.now()))
         session.commit()
+    finally:
+        session.close()
 
-        with open('DW_log.txt', 'a') as f:
-            dt = datetime.datetime.now()
-            dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-            out_str = f'TimeStamp: {dt_str} --- Added date {chk_Date} with key {chk_Date_Key} to DimDate table \n'
-            f.write(out_str)
 
-    '''
-    # Skipping this part - way too many records in dataset so a ton of writes to DW_log.txt
-    # were occurring
-    else:
-        # Log skipped date to file
-        with open('DW_log.txt', 'a') as f:
-            dt = datetime.datetime.now()
-            dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-            out_str = f'TimeStamp: {dt_str} --- Skipping duplicate date key: {chk_Date_Key} \n'
-            f.write(out_str)
-    '''
-    session.close()
+def clear_Checkpoints(ctx, pipe_names):
+    with ctx.engine_dw.begin() as conn:
+        conn.execute(delete(ETLCheckpoint).where(ETLCheckpoint.pipe_name.in_(pipe_names)))
+
+
+def write_Log(message):
+    with log_lock, open('DW_log.txt', 'a') as f:
+        dt = datetime.datetime.now()
+        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
+        f.write(f'TimeStamp: {dt_str} --- {message} \n')
+
+
+# Date functions needed for DimDate and FactAccident
+def date_Keys(dates):
+    # Date key for a whole column of dates - yyyymmdd as an integer
+    dates = pd.to_datetime(pd.Series(dates))
+    return dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day
+
+
+def generate_Dates(start_date, end_date):
+    # Every calendar day in the range with all the DimDate attributes, computed column by column
+    dates = pd.Series(pd.date_range(start_date, end_date, freq='D'))
+    return pd.DataFrame({
+        'date_key': date_Keys(dates),
+        'date': dates.dt.date,
+        'year': dates.dt.year,
+        'month': dates.dt.month,
+        'month_name': dates.dt.month_name(),
+        'week': dates.dt.strftime('%U').astype(int) + 1,
+        'week_day': dates.dt.weekday + 2,
+        'week_day_name': dates.dt.day_name(),
+        'day_number': dates.dt.day
+    })
+
+
+def load_DimDate(engine_db, engine_dw, start_date=None, end_date=None):
+    # Fill DimDate for the configured range, or the min-max accident_date of the source
+    # Accident table, before the fact load - only the missing keys are inserted
+    if start_date is None or end_date is None:
+        bounds = pd.read_sql_query(
+            "SELECT MIN(accident_date) AS min_date, MAX(accident_date) AS max_date FROM Accident", engine_db)
+        if bounds['min_date'].isna().all():
+            return 0
+        start_date = start_date if start_date is not None else bounds['min_date'].iloc[0]
+        end_date = end_date if end_date is not None else bounds['max_date'].iloc[0]
+
+    dFrame = generate_Dates(start_date, end_date)
+
+    with engine_dw.begin() as conn:
+        existing = pd.read_sql_query(
+            select(DimDate.date_key).where(DimDate.date_key.between(int(dFrame['date_key'].min()),
+                                                                    int(dFrame['date_key'].max()))), conn)
+        dFrame = dFrame[~dFrame['date_key'].isin(existing['date_key'])]
+        counter = len(insert_batches(conn, DimDate.__table__, frame_to_records(dFrame), BATCH_SIZE))
+
+    write_Log(f'Number of new date records loaded into DimDate = {counter}')
+    return counter
+
+
+# Column mappings from the OLTP extracts to the dimensions: (target column, source column, type, default)
+DIM_LOCATION_COLUMNS = [
+    ('location_easting_OSGR', 'location_easting_OSGR', 'int', None),
+    ('location_northing_OSGR', 'location_northing_OSGR', 'int', None),
+    ('LSOA', 'LSOA_of_accident_location', 'str', None),
+    ('latitude', 'latitude', 'float', None),
+    ('longitude', 'longitude', 'float', None),
+    ('location_key', 'location_key', 'int', None),
+    ('urban_rural_area', 'urban_or_rural_area', 'str', None),
+    ('local_authority_district', 'local_authority_district', 'str', None),
+    ('local_authority_highway', 'local_authority_highway', 'str', None),
+    ('in_Scotland', 'in_Scotland', 'str', None)
+]
+
+DIM_CONDITION_COLUMNS = [
+    ('src_condition_id', 'condition_id', 'int', None),
+    ('weather_conditions', 'weather_conditions', 'str', None),
+    ('road_surface_conditions', 'road_surface_conditions', 'str', None),
+    ('light_conditions', 'light_conditions', 'str', None),
+    ('carriageway_hazards', 'carriageway_hazards', 'str', None),
+    ('special_conditions', 'special_conditions_at_site', 'str', None)
+]
+
+DIM_ROAD_COLUMNS = [
+    ('src_road_id', 'road_id', 'int', None),
+    ('road_class', 'road_class', 'str', None),
+    ('road_number', 'road_number', 'int', None),
+    ('road_type', 'road_type', 'str', None),
+    ('speed_limit', 'speed_limit', 'int', None),
+    ('junction_control', 'junction_control', 'str', None),
+    ('junction_detail', 'junction_detail', 'str', None)
+]
+
+DIM_ACCIDENT_DETAIL_COLUMNS = [
+    ('accident_index', 'accident_index', 'str', None),
+    ('police_attended', 'police_attended', 'int', None),
+    ('police_force', 'police_force', 'str', None),
+    # Pedestrian crossing codes are stored as text in the DW
+    ('ped_crossing_human_control', 'pedestrian_crossing_human_control', 'code', None),
+    ('ped_crossing_physical_facilities', 'pedestrian_crossing_physical_facilities', 'code', None)
+]
+
+DIM_DRIVER_COLUMNS = [
+    ('src_driver_id', 'driver_id', 'int', None),
+    ('age_band_of_driver', 'age_band_of_driver', 'str', None),
+    ('driver_home_area_type', 'driver_home_area_type', 'str', None),
+    ('driver_IMD_decile', 'driver_IMD_decile', 'int', None),
+    ('sex', 'sex', 'str', None),
+    ('journey_purpose', 'journey_purpose', 'str', None)
+]
+
+DIM_VEHICLE_DETAIL_COLUMNS = [
+    ('src_vehicle_id', 'vehicle_id', 'int', None),
+    ('make_name', 'make_name', 'str', None),
+    ('model_name', 'model_name', 'str', None),
+    ('propulsion_code', 'propulsion_code', 'str', None),
+    ('vehicle_type', 'vehicle_type', 'str', None),
+    ('skidding_and_overturning', 'skidding_and_overturning', 'str', None),
+    ('towing_and_articulation', 'towing_and_articulation', 'str', None),
+    ('vehicle_leaving_carriageway', 'vehicle_leaving_carriageway', 'str', None),
+    ('vehicle_location_restricted_lane', 'vehicle_location_restricted_lane', 'int', None),
+    ('vehicle_manoeuvre', 'vehicle_manoeuvre', 'str', None),
+    ('vehicle_reference', 'vehicle_reference', 'int', None),
+    ('vehicle_left_hand_drive', 'vehicle_left_hand_drive', 'str', None),
+    ('first_point_of_impact', 'first_point_of_impact', 'str', None),
+    ('hit_object_in_carriageway', 'hit_object_in_carriageway', 'str', None),
+    ('hit_object_off_carriageway', 'hit_object_off_carriageway', 'str', None),
+    ('vehicle_junction_location', 'vehicle_junction_location', 'str', None)
+]
+
+# Dimension key lookups of the fact pipes: (fact column, source column, dimension, natural key)
+FACT_ACCIDENT_KEYS = [
+    ('accident_detail_id', 'accident_index', DimAccidentDetail, 'accident_index'),
+    ('road_id', 'road_id', DimRoad, 'src_road_id'),   # a source road has one row per junction, the first one wins
+    ('condition_id', 'condition_id', DimCondition, 'src_condition_id'),
+    ('location_id', 'location_key', DimLocation, 'location_key')
+]
+
+FACT_VEHICLE_KEYS = [
+    ('accident_detail_id', 'accident_index', DimAccidentDetail, 'accident_index'),
+    ('driver_id', 'driver_id', DimDriver, 'src_driver_id'),
+    ('vehicle_detail_id', 'vehicle_id', DimVehicleDetail, 'src_vehicle_id')
+]
+
+FACT_ACCIDENT_COLUMNS = [column.name for column in FactAccident.__table__.columns if not column.primary_key]
+FACT_VEHICLE_COLUMNS = [column.name for column in FactVehicle.__table__.columns if not column.primary_key]
 
 
 # ETL functions
-def pipe_Location(conStrdb, conStrdw):
-    engine_db = create_engine(conStrdb)
-    sqlQuery = 'SELECT * FROM Location'
-    dFrame = pd.read_sql_query(sqlQuery, engine_db)
-
-    # Create session
-    engine_dw = create_engine(conStrdw)
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-    counter = 0
+def pipe_Location(ctx):
+    # Location has no id or date of its own, so new locations are found through the accidents
+    # added since the last run
+    watermark = get_Watermark(ctx, 'pipe_Location')
+    new_watermark = source_Max(ctx, 'Accident', 'accident_date')
+    if watermark is None:
+        sqlQuery = f"SELECT * FROM {ctx.source_Table('Location')}"
+    else:
+        sqlQuery = (
+            "SELECT DISTINCT l.* "
+            f"FROM {ctx.source_Table('Location')} l "
+            f"JOIN {ctx.source_Table('Accident')} a ON a.location_key = l.location_key"
+        )
 
-    for _, row in dFrame.iterrows():
-        # Check if record exists - lat/long was source key
-        if not session.query(DimLocation).filter_by(
-                latitude=row['latitude'],
-                longitude=row['longitude']
-        ).first():
-            # Create new record
-            new_record = DimLocation(
-                location_easting_OSGR=row['location_easting_OSGR'],
-                location_northing_OSGR=row['location_northing_OSGR'],
-                LSOA=row['LSOA_of_accident_location'],
-                latitude=row['latitude'],
-                longitude=row['longitude'],
-                urban_rural_area=row['urban_or_rural_area'],
-                local_authority_district=row['local_authority_district'],
-                local_authority_highway=row['local_authority_highway'],
-                in_Scotland=row['in_Scotland']
-            )
-            session.add(new_record)
-            counter += 1
-        else:
-            print(f"Skipping duplicate location: lat={row['latitude']}, long={row['longitude']}")
+    # Insert the new records - the integer location key is the source key
+    counter = load_Dimension(ctx, DimLocation, sqlQuery, 'a.accident_date', watermark, DIM_LOCATION_COLUMNS,
+                             ['location_key'], inclusive=True)
 
-    session.commit()
-    session.close()
+    save_Watermark(ctx, 'pipe_Location', 'Accident', 'accident_date', new_watermark)
 
     # Log results
-    with open('DW_log.txt', 'a') as f:
-        dt = datetime.datetime.now()
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        out_str = f'TimeStamp: {dt_str} --- Number of new location records loaded into DimLocation = {counter} \n'
-        f.write(out_str)
+    write_Log(f'Number of new location records loaded into DimLocation = {counter}')
 
 #######
-def pipe_Condition(conStrdb, conStrdw):
-    engine_db = create_engine(conStrdb)
-    sqlQuery = 'SELECT * FROM Condition'
-    dFrame = pd.read_sql_query(sqlQuery, engine_db)
-
-    # Create session
-    engine_dw = create_engine(conStrdw)
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-    counter = 0
-
-    for _, row in dFrame.iterrows():
-        if not session.query(DimCondition).filter_by(src_condition_id=row['condition_id']).first():
-            new_record = DimCondition(
-                src_condition_id=row['condition_id'],
-                weather_conditions=row['weather_conditions'],
-                road_surface_conditions=row['road_surface_conditions'],
-                light_conditions=row['light_conditions'],
-                carriageway_hazards=row['carriageway_hazards'],
-                special_conditions=row['special_conditions_at_site']
-            )
-            session.add(new_record)
-            counter += 1
-        else:
-            print(f"Skipping duplicate condition: {row['condition_id']}")
+def pipe_Condition(ctx):
+    watermark = get_Watermark(ctx, 'pipe_Condition')
+    new_watermark = source_Max(ctx, 'Condition', 'condition_id')
+    sqlQuery = f"SELECT * FROM {ctx.source_Table('Condition')}"
 
-    session.commit()
-    session.close()
+    counter = load_Dimension(ctx, DimCondition, sqlQuery, 'condition_id', watermark, DIM_CONDITION_COLUMNS,
+                             ['src_condition_id'])
+    save_Watermark(ctx, 'pipe_Condition', 'Condition', 'condition_id', new_watermark)
 
     # Log results
-    with open('DW_log.txt', 'a') as f:
-        dt = datetime.datetime.now()
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        out_str = f'TimeStamp: {dt_str} --- Number of new condition records loaded into DimCondition = {counter} \n'
-        f.write(out_str)
+    write_Log(f'Number of new condition records loaded into DimCondition = {counter}')
 
 #######
-def pipe_Road(conStrdb, conStrdw):
-    engine_db = create_engine(conStrdb)
+def pipe_Road(ctx):
+    # Road-junction combinations come in with new accidents
+    watermark = get_Watermark(ctx, 'pipe_Road')
+    new_watermark = source_Max(ctx, 'Accident', 'accident_date')
     sqlQuery = (
         "SELECT DISTINCT r.road_id, r.road_class, r.road_number, r.road_type, r.speed_limit, "
         "j.junction_control, j.junction_detail "
-        "FROM Road r "
-        "JOIN Accident a ON r.road_id = a.road_id "
-        "JOIN Junction j ON a.junction_id = j.junction_id"
+        f"FROM {ctx.source_Table('Road')} r "
+        f"JOIN {ctx.source_Table('Accident')} a ON r.road_id = a.road_id "
+        f"JOIN {ctx.source_Table('Junction')} j ON a.junction_id = j.junction_id"
     )
-    dFrame = pd.read_sql_query(sqlQuery, engine_db)
-
-    # Create session
-    engine_dw = create_engine(conStrdw)
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-    counter = 0
-
-    for _, row in dFrame.iterrows():
-        # Check if combination exists
-        existing = session.query(DimRoad).filter_by(
-            src_road_id=row['road_id'],
-            junction_control=row['junction_control'],
-            junction_detail=row['junction_detail']
-        ).first()
-
-        if not existing:
-            new_record = DimRoad(
-                src_road_id=row['road_id'],
-                road_class=row['road_class'],
-                road_number=row['road_number'],
-                road_type=row['road_type'],
-                speed_limit=row['speed_limit'],
-                junction_control=row['junction_control'],
-                junction_detail=row['junction_detail']
-            )
-            session.add(new_record)
-            counter += 1
-        else:
-            print("Skipping duplicate road-junction")
 
-    session.commit()
-    session.close()
+    # Road-junction combination is the key
+    counter = load_Dimension(ctx, DimRoad, sqlQuery, 'a.accident_date', watermark, DIM_ROAD_COLUMNS,
+                             ['src_road_id', 'junction_control', 'junction_detail'], inclusive=True)
+    save_Watermark(ctx, 'pipe_Road', 'Accident', 'accident_date', new_watermark)
 
     # Log results
-    with open('DW_log.txt', 'a') as f:
-        dt = datetime.datetime.now()
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        out_str = f'TimeStamp: {dt_str} --- Number of new road-junction records loaded into DimRoad = {counter} \n'
-        f.write(out_str)
+    write_Log(f'Number of new road-junction records loaded into DimRoad = {counter}')
 
 #######
-def pipe_Accident_Detail(conStrdb, conStrdw):
-    engine_db = create_engine(conStrdb)
+def pipe_Accident_Detail(ctx):
+    watermark = get_Watermark(ctx, 'pipe_Accident_Detail')
+    new_watermark = source_Max(ctx, 'Accident', 'accident_date')
     sqlQuery = (
         "SELECT accident_index, police_attended, pedestrian_crossing_human_control, "
         "pedestrian_crossing_physical_facilities, police_force "
-        "FROM Accident"
+        f"FROM {ctx.source_Table('Accident')}"
     )
-    dFrame = pd.read_sql_query(sqlQuery, engine_db)
-
-    # Create session
-    engine_dw = create_engine(conStrdw)
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-    counter = 0
-    message = ""
-
-    for _, row in dFrame.iterrows():
-        if not session.query(DimAccidentDetail).filter_by(accident_index=row['accident_index']).first():
-            new_record = DimAccidentDetail(
-                accident_index=row['accident_index'],
-                police_attended=row['police_attended'],
-                police_force=row['police_force'],
-                # Get errors if don't handle nulls below
-                ped_crossing_human_control=int(row['pedestrian_crossing_human_control']) if pd.notnull(
-                    row['pedestrian_crossing_human_control']) else None,
-                ped_crossing_physical_facilities=row['pedestrian_crossing_physical_facilities'] if pd.notnull(
-                    row['pedestrian_crossing_physical_facilities']) else None
-            )
-            session.add(new_record)
-            # example of catching invalid row
-            try:
-                session.commit()
-                counter += 1
-            except Exception as e:
-                session.rollback()
-                message = "Error adding/processing one or more accident_index"
-        else:
-            print(f"Skipping duplicate accident record: index={row['accident_index']}")
 
-    session.commit()
-    session.close()
+    counter = load_Dimension(ctx, DimAccidentDetail, sqlQuery, 'accident_date', watermark,
+                             DIM_ACCIDENT_DETAIL_COLUMNS, ['accident_index'], inclusive=True)
+    save_Watermark(ctx, 'pipe_Accident_Detail', 'Accident', 'accident_date', new_watermark)
 
     # Log results
-    with open('DW_log.txt', 'a') as f:
-        dt = datetime.datetime.now()
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        out_str = message + '\n' + f'TimeStamp: {dt_str} --- Number of new accident-detail records loaded into DimAccidentDetail = {counter} \n'
-        f.write(out_str)
+    write_Log(f'Number of new accident-detail records loaded into DimAccidentDetail = {counter}')
 
 #######
-def pipe_Fact_Accident(conStrdb, conStrdw):
-    engine_db = create_engine(conStrdb)
+def pipe_Fact_Accident(ctx, start_date=None, end_date=None):
     sqlQuery = (
         "SELECT accident_index, road_id, condition_id, accident_date, "
         "accident_time, number_of_casualties, number_of_vehicles, "
-        "latitude, longitude "
-        "FROM Accident"
+        "location_key "
+        f"FROM {ctx.source_Table('Accident')}"
     )
-    dFrame = pd.read_sql_query(sqlQuery, engine_db)
-
-    # Create session
-    engine_dw = create_engine(conStrdw)
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-    counter = 0
-
-    for _, row in dFrame.iterrows():
-        # Add the date to DimDate if it doesn't exist
-        addNew_Date(row['accident_date'], conStrdw)
-        date_key = create_Date_Key(row['accident_date'])
-
-        # Get dimension key for accident detail
-        accident_detail = session.query(DimAccidentDetail).filter_by(accident_index=row['accident_index']).first()
-        if not accident_detail:
-            print(f"No accident detail found for index: {row['accident_index']}")
-            continue
-
-        # Get dimension key for road
-        road_record = session.query(DimRoad).filter_by(src_road_id=row['road_id']).first()
-        if not road_record:
-            print(f"No road record found for id: {row['road_id']}")
-            continue
-
-        # Get dimension key for condition
-        condition_record = session.query(DimCondition).filter_by(src_condition_id=row['condition_id']).first()
-        if not condition_record:
-            print(f"No condition record found for id: {row['condition_id']}")
-            continue
-
-        # Get dimension key for location
-        location_record = session.query(DimLocation).filter_by(
-            latitude=row['latitude'],
-            longitude=row['longitude']
-        ).first()
-        if not location_record:
-            print("No location record found for lat/long")
-            continue
-
-        # Create new fact record
-        new_record = FactAccident(
-            accident_detail_id=accident_detail.accident_detail_id,
-            date_key=date_key,
-            road_id=road_record.road_id,
-            condition_id=condition_record.condition_id,
-            location_id=location_record.location_id,
-            accident_date=row['accident_date'],
-            accident_time=row['accident_time'],
-            number_of_casualties=row['number_of_casualties'],
-            number_of_vehicles=row['number_of_vehicles']
+    watermark = get_Watermark(ctx, 'pipe_Fact_Accident')
+    new_watermark = source_Max(ctx, 'Accident', 'accident_date')
+
+    # Make sure every date is in DimDate before the facts reference it
+    load_DimDate(ctx.engine_db, ctx.engine_dw, start_date, end_date)
+
+    if ctx.pushdown:
+        # The server joins the new accidents to the dimensions and inserts the facts in one statement,
+        # accidents that already have a fact row are skipped
+        sqlInsert = (
+            "INSERT INTO FactAccident (accident_detail_id, date_key, road_id, condition_id, location_id, "
+            "accident_date, accident_time, number_of_casualties, number_of_vehicles) "
+            "SELECT dad.accident_detail_id, dd.date_key, dr.road_id, dc.condition_id, dl.location_id, "
+            "a.accident_date, a.accident_time, a.number_of_casualties, a.number_of_vehicles "
+            f"FROM {ctx.source_Table('Accident')} a "
+            "JOIN DimAccidentDetail dad ON dad.accident_index = a.accident_index "
+            "JOIN DimDate dd ON dd.date = a.accident_date "
+            "JOIN (SELECT src_road_id, MIN(road_id) AS road_id FROM DimRoad WHERE is_current = 1 "
+            "GROUP BY src_road_id) dr ON dr.src_road_id = a.road_id "
+            "JOIN DimCondition dc ON dc.src_condition_id = a.condition_id "
+            "JOIN DimLocation dl ON dl.location_key = a.location_key AND dl.is_current = 1 "
+            "WHERE NOT EXISTS (SELECT 1 FROM FactAccident fa WHERE fa.accident_detail_id = dad.accident_detail_id)"
         )
-        session.add(new_record)
-        counter += 1
-
-    session.commit()
-    session.close()
+        counter = push_Statement(ctx, sqlInsert, 'a.accident_date', watermark, inclusive=True)
+        sqlUnresolved = (
+            "SELECT MIN(a.accident_date) "
+            f"FROM {ctx.source_Table('Accident')} a "
+            "WHERE NOT EXISTS (SELECT 1 FROM FactAccident fa "
+            "JOIN DimAccidentDetail dad ON fa.accident_detail_id = dad.accident_detail_id "
+            "WHERE dad.accident_index = a.accident_index)"
+        )
+        unresolved = push_Unresolved(ctx, sqlUnresolved, 'a.accident_date', watermark, inclusive=True)
+    else:
+        # The last loaded day is read again, a full run (to pick up dimension changes) reads everything
+        # and an interrupted run may have committed some partitions, drop the accidents that already
+        # have a fact row
+        resolvers = key_Resolvers(ctx, FACT_ACCIDENT_KEYS)
+        counter = 0
+        unresolved = None
+        for dFrame in read_Incremental(ctx, sqlQuery, 'accident_date', watermark, inclusive=True):
+            loaded = loaded_Facts(ctx, DimAccidentDetail.accident_index, DimAccidentDetail.accident_detail_id,
+                                  FactAccident.accident_detail_id, dFrame['accident_index'])
+            dFrame = dFrame[~dFrame['accident_index'].isin(loaded)]
+
+            # Date keys for the whole chunk
+            dFrame['accident_date'] = pd.to_datetime(dFrame['accident_date']).dt.date
+            dFrame['date_key'] = date_Keys(dFrame['accident_date'])
+            # SQL Server hands back time objects but SQLite returns 'HH:MM:SS.ffffff' text, so normalise
+            # both to time objects (NULL stays NULL)
+            dFrame['accident_time'] = (pd.Timestamp(0) +
+                                       pd.to_timedelta(dFrame['accident_time'].astype('string'))).dt.time
+
+            # Swap the source keys for dimension keys for the whole chunk, then insert the partitions
+            resolved = resolve_Keys(dFrame, resolvers)
+            unresolved = first_Unresolved(dFrame, resolved, 'accident_date', unresolved)
+            inserted = load_Partitions(ctx, resolved, 'accident_index', fact_Accident_Partition)
+            ctx.metrics.add(rows_inserted=inserted, rows_skipped=len(dFrame) - inserted)
+            counter += inserted
+
+    new_watermark = capped_Watermark(new_watermark, unresolved, inclusive=True)
+    save_Watermark(ctx, 'pipe_Fact_Accident', 'Accident', 'accident_date', new_watermark)
 
     # Log results
-    with open('DW_log.txt', 'a') as f:
-        dt = datetime.datetime.now()
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        out_str = f'TimeStamp: {dt_str} --- Number of new records loaded into FactAccident = {counter} \n'
-        f.write(out_str)
+    write_Log(f'Number of new records loaded into FactAccident = {counter}')
+    rollup_Facts(ctx, 'FactAccident')
 
-#######
-def pipe_Driver(conStrdb, conStrdw):
-    engine_db = create_engine(conStrdb)
-    sqlQuery = "SELECT * FROM Driver"
 
-    dFrame = pd.read_sql_query(sqlQuery, engine_db)
-
-    engine_dw = create_engine(conStrdw)
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-    counter = 0
-    message = ""
-
-    for _, row in dFrame.iterrows():
-        # Check if exists
-        existing = session.query(DimDriver).filter_by(
-            src_driver_id=row['driver_id']
-        ).first()
-
-        if not existing:
-            # Handle NaN in driver_IMD_decile
-            imd_decile = None
-            if pd.notnull(row['driver_IMD_decile']):
-                imd_decile = int(row['driver_IMD_decile'])
-
-            new_record = DimDriver(
-                src_driver_id=row['driver_id'],
-                age_band_of_driver=row['age_band_of_driver'],
-                driver_home_area_type=row['driver_home_area_type'],
-                driver_IMD_decile=imd_decile,  # Use None for NaN
-                sex=row['sex'],
-                journey_purpose=row['journey_purpose'],
-            )
-            try:
-                session.add(new_record)
-                session.commit()
-                counter += 1
-            except Exception as e:
-                session.rollback()
-                message += f"Error adding driver ID {row['driver_id']}: {str(e)}\n"
+def fact_Accident_Partition(dFrame, session):
+    # The dimension keys are already resolved, write the partition in batches
+    return len(insert_batches(session, FactAccident.__table__, frame_to_records(dFrame[FACT_ACCIDENT_COLUMNS]),
+                              BATCH_SIZE))
 
-        else:
-            print(f"Skipping duplicate driver: driver_id={row['driver_id']}")
+#######
+def pipe_Driver(ctx):
+    watermark = get_Watermark(ctx, 'pipe_Driver')
+    new_watermark = source_Max(ctx, 'Driver', 'driver_id')
+    sqlQuery = f"SELECT * FROM {ctx.source_Table('Driver')}"
 
-    session.close()
+    counter = load_Dimension(ctx, DimDriver, sqlQuery, 'driver_id', watermark, DIM_DRIVER_COLUMNS, ['src_driver_id'])
+    save_Watermark(ctx, 'pipe_Driver', 'Driver', 'driver_id', new_watermark)
 
     # Log results
-    with open('DW_log.txt', 'a') as f:
-        dt = datetime.datetime.now()
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        if message:
-            f.write(message + '\n')
-        out_str = f'TimeStamp: {dt_str} --- Number of new driver records loaded into DimDriver = {counter} \n'
-        f.write(out_str)
+    write_Log(f'Number of new driver records loaded into DimDriver = {counter}')
 
 #######
-def pipe_Vehicle_Detail(conStrdb, conStrdw):
-    engine_db = create_engine(conStrdb)
+def pipe_Vehicle_Detail(ctx):
 
     sqlQuery = (
         "SELECT v.vehicle_id, v.accident_index, mk.make_name, md.model_name, " 
@@ -537,140 +1022,177 @@ def pipe_Vehicle_Detail(conStrdb, conStrdw):
         "v.vehicle_reference, v.vehicle_left_hand_drive, "
         "v.first_point_of_impact, v.hit_object_in_carriageway, "
         "v.hit_object_off_carriageway, v.vehicle_junction_location "
-        "FROM Vehicle v "
-        "LEFT JOIN VehicleMake mk ON v.make_id = mk.make_id "
-        "LEFT JOIN VehicleModel md ON v.model_id = md.model_id"
+        f"FROM {ctx.source_Table('Vehicle')} v "
+        f"LEFT JOIN {ctx.source_Table('VehicleMake')} mk ON v.make_id = mk.make_id "
+        f"LEFT JOIN {ctx.source_Table('VehicleModel')} md ON v.model_id = md.model_id"
     )
-    dFrame = pd.read_sql_query(sqlQuery, engine_db)
+    watermark = get_Watermark(ctx, 'pipe_Vehicle_Detail')
+    new_watermark = source_Max(ctx, 'Vehicle', 'vehicle_id')
 
-    # Create session
-    engine_dw = create_engine(conStrdw)
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-    counter = 0
-    message = ""
-
-    for _, row in dFrame.iterrows():
-        # Check if vehicle ID already exists
-        if not session.query(DimVehicleDetail).filter_by(src_vehicle_id=row['vehicle_id']).first():
-            # Create new record
-            new_record = DimVehicleDetail(
-                src_vehicle_id=row['vehicle_id'],
-                make_name=row['make_name'] if pd.notnull(row['make_name']) else None,
-                model_name=row['model_name'] if pd.notnull(row['model_name']) else None,
-                propulsion_code=row['propulsion_code'] if pd.notnull(row['propulsion_code']) else None,
-                vehicle_type=row['vehicle_type'],
-                skidding_and_overturning=row['skidding_and_overturning'] if pd.notnull(
-                    row['skidding_and_overturning']) else None,
-                towing_and_articulation=row['towing_and_articulation'],
-                vehicle_leaving_carriageway=row['vehicle_leaving_carriageway'],
-                vehicle_location_restricted_lane=row['vehicle_location_restricted_lane'] if pd.notnull(
-                    row['vehicle_location_restricted_lane']) else None,
-                vehicle_manoeuvre=row['vehicle_manoeuvre'],
-                vehicle_reference=row['vehicle_reference'],
-                vehicle_left_hand_drive=row['vehicle_left_hand_drive'],
-                first_point_of_impact=row['first_point_of_impact'],
-                hit_object_in_carriageway=row['hit_object_in_carriageway'] if pd.notnull(
-                    row['hit_object_in_carriageway']) else None,
-                hit_object_off_carriageway=row['hit_object_off_carriageway'] if pd.notnull(
-                    row['hit_object_off_carriageway']) else None,
-                vehicle_junction_location=row['vehicle_junction_location']
-            )
-            session.add(new_record)
-            counter += 1
-
-        else:
-            message += f"Skipping duplicate vehicle detail: ID={row['vehicle_id']}"
-
-
-    session.commit()
-    session.close()
+    counter = load_Dimension(ctx, DimVehicleDetail, sqlQuery, 'v.vehicle_id', watermark, DIM_VEHICLE_DETAIL_COLUMNS,
+                             ['src_vehicle_id'])
+    save_Watermark(ctx, 'pipe_Vehicle_Detail', 'Vehicle', 'vehicle_id', new_watermark)
 
-
-    with open('DW_log.txt', 'a') as f:
-        dt = datetime.datetime.now()
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        if message:
-            f.write(message + '\n')
-        out_str = f'TimeStamp: {dt_str} --- Number of new vehicle detail records loaded to DimVehicleDetail = {counter} \n'
-        f.write(out_str)
+    write_Log(f'Number of new vehicle detail records loaded to DimVehicleDetail = {counter}')
 
 #######
 
-def pipe_Fact_Vehicle(conStrdb, conStrdw):
-    engine_db = create_engine(conStrdb)
+def pipe_Fact_Vehicle(ctx):
 
     # Simplified query to get the fact data
     sqlQuery = (
         "SELECT v.vehicle_id, a.accident_index, v.driver_id, v.age_of_vehicle, v.engine_capacity_CC "
-        "FROM Vehicle v "
-        "JOIN Accident a ON v.accident_index = a.accident_index"
+        f"FROM {ctx.source_Table('Vehicle')} v "
+        f"JOIN {ctx.source_Table('Accident')} a ON v.accident_index = a.accident_index"
     )
-    dFrame = pd.read_sql_query(sqlQuery, engine_db)
-
-    # Create session
-    engine_dw = create_engine(conStrdw)
-    Session = sessionmaker(bind=engine_dw)
-    session = Session()
-    counter = 0
-
-    for _, row in dFrame.iterrows():
-        # Get the accident_detail_id from DimAccidentDetail using accident_index
-        accident_detail = session.query(DimAccidentDetail).filter_by(
-            accident_index=row['accident_index']
-        ).first()
-
-        if not accident_detail:
-            print(f"No accident detail found for index: {row['accident_index']}")
-            continue
-
-        # Get the driver_id from DimDriver
-        driver = session.query(DimDriver).filter_by(
-            src_driver_id=row['driver_id']
-        ).first()
-
-        if not driver:
-            print(f"No driver found for id: {row['driver_id']}")
-            continue
-
-        vehicle_detail = session.query(DimVehicleDetail).filter_by(
-            src_vehicle_id=row['vehicle_id']
-        ).first()
-
-        if not vehicle_detail:
-            print(f"No vehicle detail found for id: {row['vehicle_id']}")
-            continue
-
-        # Create new record
-        new_record = FactVehicle(
-            accident_detail_id=accident_detail.accident_detail_id,
-            driver_id=driver.driver_id,
-            vehicle_detail_id=vehicle_detail.vehicle_detail_id,
-            age_of_vehicle=row['age_of_vehicle'] if pd.notnull(row['age_of_vehicle']) else None,
-            engine_capacity_CC=row['engine_capacity_CC'] if pd.notnull(row['engine_capacity_CC']) else None
-
+    watermark = get_Watermark(ctx, 'pipe_Fact_Vehicle')
+    new_watermark = source_Max(ctx, 'Vehicle', 'vehicle_id')
+
+    if ctx.pushdown:
+        sqlInsert = (
+            "INSERT INTO FactVehicle (accident_detail_id, driver_id, vehicle_detail_id, age_of_vehicle, "
+            "engine_capacity_CC) "
+            "SELECT dad.accident_detail_id, dd.driver_id, dvd.vehicle_detail_id, "
+            "v.age_of_vehicle, v.engine_capacity_CC "
+            f"FROM {ctx.source_Table('Vehicle')} v "
+            f"JOIN {ctx.source_Table('Accident')} a ON v.accident_index = a.accident_index "
+            "JOIN DimAccidentDetail dad ON dad.accident_index = a.accident_index "
+            "JOIN DimDriver dd ON dd.src_driver_id = v.driver_id AND dd.is_current = 1 "
+            "JOIN DimVehicleDetail dvd ON dvd.src_vehicle_id = v.vehicle_id AND dvd.is_current = 1 "
+            # A vehicle's fact row may point at an older version of its DimVehicleDetail row
+            "WHERE NOT EXISTS (SELECT 1 FROM FactVehicle fv "
+            "JOIN DimVehicleDetail fvd ON fv.vehicle_detail_id = fvd.vehicle_detail_id "
+            "WHERE fvd.src_vehicle_id = v.vehicle_id)"
         )
-        session.add(new_record)
-        counter += 1
-
-    session.commit()
-    session.close()
+        counter = push_Statement(ctx, sqlInsert, 'v.vehicle_id', watermark)
+        sqlUnresolved = (
+            "SELECT MIN(v.vehicle_id) "
+            f"FROM {ctx.source_Table('Vehicle')} v "
+            f"JOIN {ctx.source_Table('Accident')} a ON v.accident_index = a.accident_index "
+            "WHERE NOT EXISTS (SELECT 1 FROM FactVehicle fv "
+            "JOIN DimVehicleDetail fvd ON fv.vehicle_detail_id = fvd.vehicle_detail_id "
+            "WHERE fvd.src_vehicle_id = v.vehicle_id)"
+        )
+        unresolved = push_Unresolved(ctx, sqlUnresolved, 'v.vehicle_id', watermark)
+    else:
+        # A full run reads every vehicle again and partitions of a failed run may already be committed,
+        # skip vehicles that have a fact row (through any version of their DimVehicleDetail row)
+        resolvers = key_Resolvers(ctx, FACT_VEHICLE_KEYS)
+        counter = 0
+        unresolved = None
+        for dFrame in read_Incremental(ctx, sqlQuery, 'v.vehicle_id', watermark):
+            loaded = loaded_Facts(ctx, DimVehicleDetail.src_vehicle_id, DimVehicleDetail.vehicle_detail_id,
+                                  FactVehicle.vehicle_detail_id, dFrame['vehicle_id'])
+            dFrame = dFrame[~dFrame['vehicle_id'].isin(loaded)]
+
+            resolved = resolve_Keys(dFrame, resolvers)
+            unresolved = first_Unresolved(dFrame, resolved, 'vehicle_id', unresolved)
+            inserted = load_Partitions(ctx, resolved, 'accident_index', fact_Vehicle_Partition)
+            ctx.metrics.add(rows_inserted=inserted, rows_skipped=len(dFrame) - inserted)
+            counter += inserted
+
+    new_watermark = capped_Watermark(new_watermark, unresolved)
+    save_Watermark(ctx, 'pipe_Fact_Vehicle', 'Vehicle', 'vehicle_id', new_watermark)
+
+    write_Log(f'Number of new vehicle records loaded into FactVehicle = {counter}')
+    rollup_Facts(ctx, 'FactVehicle')
+
+
+def fact_Vehicle_Partition(dFrame, session):
+    return len(insert_batches(session, FactVehicle.__table__, frame_to_records(dFrame[FACT_VEHICLE_COLUMNS]),
+                              BATCH_SIZE))
+
+def rollup_Facts(ctx, fact):
+    # Roll the facts loaded since the last refresh up into the aggregates of the fact
+    if not ctx.aggregates:
+        return
+    for name, counter in refresh_aggregates(ctx.engine_dw, Base.metadata, fact).items():
+        write_Log(f'Number of new {fact} records rolled up into {name} = {counter}')
 
+#####################################################################################
+# Scheduling - the dimension pipes don't depend on each other, the fact pipes need their dimensions
+PIPE_DEPENDENCIES = {
+    pipe_Location: [],
+    pipe_Condition: [],
+    pipe_Road: [],
+    pipe_Accident_Detail: [],
+    pipe_Driver: [],
+    pipe_Vehicle_Detail: [],
+    pipe_Fact_Accident: [pipe_Location, pipe_Condition, pipe_Road, pipe_Accident_Detail],
+    pipe_Fact_Vehicle: [pipe_Accident_Detail, pipe_Driver, pipe_Vehicle_Detail],
+}
+
+
+def run_Pipe(ctx, pipe):
+    # Run one pipe as a metrics stage, with its checkpoint marked running until it finishes
+    if ctx.checkpoint:
+        save_Checkpoint(ctx, pipe.__name__, 'running')
+    with ctx.metrics.stage(pipe.__name__, loader='load_to_data_warehouse'):
+        pipe(ctx)
+    if ctx.checkpoint:
+        save_Checkpoint(ctx, pipe.__name__, 'done')
+
+
+def run_Pipeline(ctx, pipes=None, max_workers=None):
+    # Run each pipe as soon as the pipes it depends on are done. Independent pipes run at the same
+    # time on a thread pool, each with its own DW connection from the context's pool. Dependencies
+    # outside the requested pipes count as done
+    pipes = list(pipes) if pipes is not None else list(PIPE_DEPENDENCIES)
+    waiting = {pipe: {dep for dep in PIPE_DEPENDENCIES.get(pipe, []) if dep in pipes} for pipe in pipes}
+    max_workers = max_workers or ctx.max_workers
+
+    done = set()
+    running = {}
+
+    # Resume an unfinished run - pipes that finished count as done, the ones it was running start again.
+    # A finished dimension pipe still runs again when a pipe that depends on it has to run, so the facts
+    # see the source rows added since the interrupted run (the merges skip rows that are already loaded)
+    if ctx.checkpoint:
+        checkpoints = get_Checkpoints(ctx)
+        finished = {pipe for pipe in waiting if checkpoints.get(pipe.__name__) == 'done'}
+        rerun = {dep for pipe, deps in waiting.items() if pipe not in finished for dep in deps}
+        while rerun & finished:
+            finished -= rerun
+            rerun = {dep for pipe, deps in waiting.items() if pipe not in finished for dep in deps}
+        for pipe in [pipe for pipe in pipes if pipe in finished]:
+            del waiting[pipe]
+            done.add(pipe)
+            write_Log(f'{pipe.__name__} skipped, already finished by the interrupted run')
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while waiting or running:
+            # Start everything that is ready, unless a pipe already failed
+            if error is None:
+                for pipe in [pipe for pipe, deps in waiting.items() if deps <= done]:
+                    del waiting[pipe]
+                    running[executor.submit(run_Pipe, ctx, pipe)] = pipe
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                pipe = running.pop(future)
+                if future.exception() is not None:
+                    write_Log(f'{pipe.__name__} failed: {future.exception()}')
+                    error = error or future.exception()
+                else:
+                    done.add(pipe)
+
+    if error is not None:
+        raise error
+    if waiting:
+        raise RuntimeError(f"Pipes never became ready: {[pipe.__name__ for pipe in waiting]}")
+
+    # The run is complete, the next one starts every pipe again
+    if ctx.checkpoint:
+        clear_Checkpoints(ctx, [pipe.__name__ for pipe in pipes])
 
-    with open('DW_log.txt', 'a') as f:
-        dt = datetime.datetime.now()
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        out_str = f'TimeStamp: {dt_str} --- Number of new vehicle records loaded into FactVehicle = {counter} \n'
-        f.write(out_str)
 
 #####################################################################################
 # Load it all here
-'''pipe_Location(conn_string_db, conn_string_dw)
-pipe_Condition(conn_string_db, conn_string_dw)
-pipe_Road(conn_string_db, conn_string_dw)
-pipe_Accident_Detail(conn_string_db, conn_string_dw)
-pipe_Fact_Accident(conn_string_db, conn_string_dw)
-pipe_Driver(conn_string_db, conn_string_dw)
-pipe_Vehicle_Detail(conn_string_db, conn_string_dw)
-'''
-pipe_Fact_Vehicle(conn_string_db, conn_string_dw)
+if __name__ == '__main__':
+    with ETLContext(conn_string_db, conn_string_dw, metrics=MetricsRegistry('DW_metrics.jsonl')) as ctx:
+        run_Pipeline(ctx)
+        print(ctx.metrics.summary())
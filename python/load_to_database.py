@@ -1,11 +1,20 @@
 import pandas as pd
+import numpy as np
+import pyarrow.dataset as ds
+import os
 import urllib
 import datetime
+import hashlib
 # Import important sqlalchemy classes
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Date, Time, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Float, Date, Time, ForeignKey
 from sqlalchemy.orm import DeclarativeBase, relationship
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import ForeignKeyConstraint
+from sqlalchemy import ForeignKeyConstraint, select, delete, func
+
+from etl_utils import engine_options, frame_to_records, insert_batches, reject_file as open_reject_file
+from etl_utils import str_column, key_column, map_columns, location_key, existing_keys
+from etl_metrics import MetricsRegistry
+from source_schema import ACCIDENT_SCHEMA, VEHICLE_SCHEMA, source_dtypes
 
 # Define the connection strings to db
 # Conn strings edited for security
@@ -26,6 +35,8 @@ class Location(Base):
     # Using latitude and longitude as composite primary key
     latitude = Column(Float, primary_key=True)
     longitude = Column(Float, primary_key=True)
+    # Integer encoding of latitude/longitude (etl_utils.location_key), shared with DimLocation
+    location_key = Column(BigInteger)
     location_easting_OSGR = Column(Integer)
     location_northing_OSGR = Column(Integer)
     LSOA_of_accident_location = Column(String(255))
@@ -95,6 +106,7 @@ class Accident(Base):
     accident_index = Column(String(255), primary_key=True)
     latitude = Column(Float)
     longitude = Column(Float)
+    location_key = Column(BigInteger)
     road_id = Column(Integer, ForeignKey('Road.road_id'))
     junction_id = Column(Integer, ForeignKey('Junction.junction_id'))
     condition_id = Column(Integer, ForeignKey('Condition.condition_id'))
@@ -154,479 +166,913 @@ class Vehicle(Base):
     driver = relationship("Driver")
 
 
+# Control table for resumable loads - one row per phase (and chunk) a run has committed
+class LoadCheckpoint(Base):
+    __tablename__ = 'LoadCheckpoint'
+
+    run_key = Column(String(40), primary_key=True)   # hash of the files, mode and chunksize
+    step = Column(String(100), primary_key=True)     # '<phase method>:<chunk>'
+    completed_at = Column(DateTime)
+
+
+# Source columns the loader reads, typed from source_schema so every chunk of a streamed CSV
+# gets the same (compact) types and nothing has to be inferred
+ACCIDENT_DTYPES = source_dtypes(ACCIDENT_SCHEMA, [
+    'Accident_Index', '1st_Road_Class', '1st_Road_Number', 'Carriageway_Hazards', 'Date',
+    'Did_Police_Officer_Attend_Scene_of_Accident', 'Junction_Control', 'Junction_Detail', 'Latitude',
+    'Light_Conditions', 'Local_Authority_(District)', 'Local_Authority_(Highway)', 'Location_Easting_OSGR',
+    'Location_Northing_OSGR', 'Longitude', 'LSOA_of_Accident_Location', 'Number_of_Casualties',
+    'Number_of_Vehicles', 'Pedestrian_Crossing-Human_Control', 'Pedestrian_Crossing-Physical_Facilities',
+    'Police_Force', 'Road_Surface_Conditions', 'Road_Type', 'Special_Conditions_at_Site', 'Speed_limit',
+    'Time', 'Urban_or_Rural_Area', 'Weather_Conditions', 'InScotland'
+])
+
+VEHICLE_DTYPES = source_dtypes(VEHICLE_SCHEMA, [
+    'Accident_Index', 'Age_Band_of_Driver', 'Age_of_Vehicle', 'Driver_Home_Area_Type', 'Driver_IMD_Decile',
+    'Engine_Capacity_.CC.', 'Hit_Object_in_Carriageway', 'Hit_Object_off_Carriageway',
+    'Journey_Purpose_of_Driver', 'Junction_Location', 'make', 'model', 'Propulsion_Code', 'Sex_of_Driver',
+    'Skidding_and_Overturning', 'Towing_and_Articulation', 'Vehicle_Leaving_Carriageway',
+    'Vehicle_Location.Restricted_Lane', 'Vehicle_Manoeuvre', 'Vehicle_Reference', 'Vehicle_Type',
+    'Was_Vehicle_Left_Hand_Drive', 'X1st_Point_of_Impact'
+])
+
+
+def _read_source(filename, dtypes, chunksize=None):
+    # Only the columns the loader uses are read; with a chunksize this returns an iterator of frames.
+    # Parquet extracts and staging directories are read column-projected, anything else as CSV
+    if os.path.isdir(filename) or filename.endswith('.parquet'):
+        return _read_parquet(filename, dtypes, chunksize)
+    return pd.read_csv(filename, usecols=lambda column: column in dtypes, dtype=dtypes, chunksize=chunksize)
+
+
+def _read_parquet(filename, dtypes, chunksize=None):
+    dataset = ds.dataset(filename, format='parquet', partitioning='hive')
+    columns = [column for column in dtypes if column in dataset.schema.names]
+    types = {column: dtypes[column] for column in columns}
+    if chunksize is None:
+        return dataset.to_table(columns=columns).to_pandas().astype(types)
+    return (batch.to_pandas().astype(types) for batch in dataset.to_batches(columns=columns, batch_size=chunksize))
+
+
+CONDITION_ATTRIBUTES = ['weather_conditions', 'road_surface_conditions', 'light_conditions',
+                        'special_conditions_at_site', 'carriageway_hazards']
+
+
+# Source date and time formats, anything else falls back to format inference
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H:%M'
+
+
+def _parse_column(series, format, cache):
+    # Parse each distinct value once with the explicit format. Values that don't match are
+    # parsed again in one vectorized call with format inference, what still fails becomes NaT.
+    # Results are kept in cache so later chunks only parse values they haven't seen
+    values = series.astype(object).where(series.notna(), None)
+    new_values = pd.Series([value for value in values.dropna().unique() if value not in cache], dtype=object)
+    if len(new_values):
+        parsed = pd.to_datetime(new_values, format=format, errors='coerce')
+        failed = parsed.isna()
+        if failed.any():
+            parsed[failed] = pd.to_datetime(new_values[failed], format='mixed', errors='coerce')
+        cache.update(zip(new_values, parsed))
+    return pd.to_datetime(values.map(cache))
+
+
+# Column mappings from the source files to the tables: (target column, source column, type, default).
+# map_columns converts each one for the whole frame, the defaults replace missing values
+LOCATION_COLUMNS = [
+    ('latitude', 'Latitude', 'float', None),
+    ('longitude', 'Longitude', 'float', None),
+    ('location_easting_OSGR', 'Location_Easting_OSGR', 'int', 0),
+    ('location_northing_OSGR', 'Location_Northing_OSGR', 'int', 0),
+    ('LSOA_of_accident_location', 'LSOA_of_Accident_Location', 'str', 'Unknown'),
+    ('urban_or_rural_area', 'Urban_or_Rural_Area', 'str', 'Unknown'),
+    ('in_Scotland', 'InScotland', 'str', 'No'),
+    ('local_authority_district', 'Local_Authority_(District)', 'str', 'Unknown'),
+    ('local_authority_highway', 'Local_Authority_(Highway)', 'str', 'Unknown')
+]
+
+ROAD_COLUMNS = [
+    ('road_class', '1st_Road_Class', 'str', None),
+    ('road_number', '1st_Road_Number', 'int', 0),
+    ('road_type', 'Road_Type', 'str', None),
+    ('speed_limit', 'Speed_limit', 'int', None)
+]
+
+JUNCTION_COLUMNS = [
+    ('junction_control', 'Junction_Control', 'key', None),
+    ('junction_detail', 'Junction_Detail', 'key', None)
+]
+
+CONDITION_COLUMNS = [
+    ('weather_conditions', 'Weather_Conditions', 'str', None),
+    ('road_surface_conditions', 'Road_Surface_Conditions', 'str', None),
+    ('light_conditions', 'Light_Conditions', 'str', None),
+    ('special_conditions_at_site', 'Special_Conditions_at_Site', 'str', None),
+    ('carriageway_hazards', 'Carriageway_Hazards', 'str', None)
+]
+
+ACCIDENT_COLUMNS = [
+    ('accident_index', 'Accident_Index', 'str', None),
+    ('latitude', 'Latitude', 'float', None),
+    ('longitude', 'Longitude', 'float', None),
+    ('police_attended', 'Did_Police_Officer_Attend_Scene_of_Accident', 'int', None),
+    ('number_of_casualties', 'Number_of_Casualties', 'int', 0),
+    ('number_of_vehicles', 'Number_of_Vehicles', 'int', 0),
+    ('pedestrian_crossing_human_control', 'Pedestrian_Crossing-Human_Control', 'int', None),
+    ('pedestrian_crossing_physical_facilities', 'Pedestrian_Crossing-Physical_Facilities', 'int', None),
+    ('police_force', 'Police_Force', 'str', None)
+]
+
+# Natural keys an accident is matched to its road and condition on
+ROAD_KEY_COLUMNS = ROAD_COLUMNS[:2]
+CONDITION_KEY_COLUMNS = CONDITION_COLUMNS[:3]
+
+DRIVER_COLUMNS = [
+    ('age_band_of_driver', 'Age_Band_of_Driver', 'str', 'Unknown'),
+    ('driver_home_area_type', 'Driver_Home_Area_Type', 'str', 'Unknown'),
+    ('driver_IMD_decile', 'Driver_IMD_Decile', 'int', None),
+    ('sex', 'Sex_of_Driver', 'str', 'Unknown'),
+    ('journey_purpose', 'Journey_Purpose_of_Driver', 'str', 'Unknown')
+]
+
+VEHICLE_COLUMNS = [
+    ('accident_index', 'Accident_Index', 'str', None),
+    ('age_of_vehicle', 'Age_of_Vehicle', 'int', None),
+    ('propulsion_code', 'Propulsion_Code', 'str', None),
+    ('vehicle_type', 'Vehicle_Type', 'str', 'Unknown'),
+    ('engine_capacity_CC', 'Engine_Capacity_.CC.', 'int', None),
+    ('skidding_and_overturning', 'Skidding_and_Overturning', 'str', None),
+    ('towing_and_articulation', 'Towing_and_Articulation', 'str', 'Unknown'),
+    ('vehicle_leaving_carriageway', 'Vehicle_Leaving_Carriageway', 'str', 'Unknown'),
+    ('vehicle_location_restricted_lane', 'Vehicle_Location.Restricted_Lane', 'int', None),
+    ('vehicle_manoeuvre', 'Vehicle_Manoeuvre', 'str', 'Unknown'),
+    ('vehicle_reference', 'Vehicle_Reference', 'int', 0),
+    ('vehicle_left_hand_drive', 'Was_Vehicle_Left_Hand_Drive', 'str', 'Unknown'),
+    ('first_point_of_impact', 'X1st_Point_of_Impact', 'str', 'Unknown'),
+    ('hit_object_in_carriageway', 'Hit_Object_in_Carriageway', 'str', None),
+    ('hit_object_off_carriageway', 'Hit_Object_off_Carriageway', 'str', None),
+    ('vehicle_junction_location', 'Junction_Location', 'str', 'Unknown')
+]
+
+VEHICLE_KEY_COLUMNS = [column for column in VEHICLE_COLUMNS if column[0] in ('accident_index', 'vehicle_reference')]
+
+
 class TrafficAccidentDataLoader:
-    def __init__(self, connection_string):
+    def __init__(self, connection_string, mode='bulk', batch_size=10000, metrics=None, reject_file=None,
+                 checkpoint=False):
         # Create engine and session
-        self.engine = create_engine(connection_string)
+        self.engine = create_engine(connection_string, **engine_options(connection_string))
         self.Session = sessionmaker(bind=self.engine)
 
-    def load_data(self, accidents_file, vehicles_file):
-       # Main data loading
-        print("Starting data loading process...")
-
-        # Read CSVs
-        accident_df = pd.read_csv(accidents_file)
-        vehicle_df = pd.read_csv(vehicles_file)
+        # Wall time, row counts and round trips for every phase, pass a MetricsRegistry with a path
+        # to also get them as JSON lines
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.metrics.watch_engine(self.engine)
+
+        # 'bulk' converts each table as whole columns and writes it with executemany,
+        # 'row' is the original one-object-per-row path, kept as a debug fallback
+        if mode not in ('bulk', 'row'):
+            raise ValueError(f"Unknown load mode: {mode}")
+        self.mode = mode
+        self.batch_size = batch_size
+
+        # A batch that fails to insert is retried in halves inside savepoints until the bad rows are
+        # isolated, those are counted as rows_rejected and appended to a JSON-lines reject file.
+        # Without a reject file the first failing batch still aborts the load
+        self.write_reject = open_reject_file(reject_file) if reject_file else None
+        self.on_reject = self._reject if reject_file else None
+
+        # With checkpoint every phase (of every chunk) commits on its own together with a row in
+        # LoadCheckpoint, so a rerun of a failed load skips what was committed and carries on from there
+        self.checkpoint = checkpoint
+        self.run_key = None
+        self.completed_steps = set()
+        if checkpoint:
+            LoadCheckpoint.__table__.create(self.engine, checkfirst=True)
+
+        # Natural key -> surrogate id maps for the lookup tables. They are seeded from the database
+        # and filled as Road, Junction, Condition and Make/Model are loaded, so Accident and Vehicle
+        # foreign keys are resolved in memory instead of with a SELECT per row
+        self.road_ids = {}          # (road_class, road_number) -> road_id
+        self.junction_ids = {}      # (junction_control, junction_detail) -> junction_id
+        self.condition_ids = {}     # (weather, road surface, light) -> condition_id
+        self.make_ids = {}          # make_name -> make_id
+        self.model_ids = {}         # model_name -> model_id
+        self.default_condition_id = None
+
+        # Attribute combinations already in Road and Condition, so streamed chunks don't insert a row
+        # an earlier chunk already loaded. Locations and accidents are too many to hold, each chunk
+        # looks its own keys up in the database instead
+        self.loaded_roads = set()       # (road_class, road_number, road_type, speed_limit)
+        self.loaded_conditions = set()  # every Condition attribute
+
+        # Parsed Date and Time values by source text, shared by all chunks
+        self.parsed_dates = {}
+        self.parsed_times = {}
+
+    def _reject(self, table, record, error):
+        self.metrics.add(rows_rejected=1)
+        if self.write_reject is not None:
+            self.write_reject(table, record, error)
+
+    def load_data(self, accidents_file, vehicles_file, chunksize=None):
+       # Main data loading. With a chunksize the CSVs are streamed and each chunk is committed
+       # on its own, so memory stays bounded by the chunk size rather than the file size
+        print(f"Starting data loading process ({self.mode} mode)...")
+
+        if chunksize is not None and self.mode != 'bulk':
+            raise ValueError("Chunked loading is only available in bulk mode")
+
+        # Tables fed by each file, in dependency order - dimensions first, then Accident, then Driver/Vehicle
+        if self.mode == 'bulk':
+            accident_phases = [
+                ("Location", self._bulk_load_locations),
+                ("Road", self._bulk_load_roads),
+                ("Junction", self._bulk_load_junctions),
+                ("Condition", self._bulk_load_conditions),
+                ("Accident", self._bulk_load_accidents),
+            ]
+            vehicle_phases = [
+                ("Vehicle Make/Model", self._bulk_load_vehicle_makes_models),
+                ("Vehicle and Driver", self._bulk_load_vehicles_drivers),
+            ]
+        else:
+            accident_phases = [
+                ("Location", self._load_locations),
+                ("Road", self._load_roads),
+                ("Junction", self._load_junctions),
+                ("Condition", self._load_conditions),
+                ("Accident", self._load_accidents),
+            ]
+            vehicle_phases = [
+                ("Vehicle Make/Model", self._load_vehicle_makes_models),
+                ("Vehicle and Driver", self._load_vehicles_drivers),
+            ]
 
         # Create session
         session = self.Session()
 
         try:
-            # Load all Location records
-            print("Loading Location data...")
-            self._load_locations(accident_df, session)
-
-            # Load all Road records
-            print("Loading Road data...")
-            self._load_roads(accident_df, session)
-
-            # Load all Junction records
-            print("Loading Junction data...")
-            self._load_junctions(accident_df, session)
-
-            # Load all Condition records
-            print("Loading Condition data...")
-            self._load_conditions(accident_df, session)
+            if self.checkpoint:
+                self._load_checkpoints(session, accidents_file, vehicles_file, chunksize)
+
+            with self.metrics.stage('_load_key_maps', loader='load_to_database', mode=self.mode):
+                self._load_key_maps(session)
+
+            if chunksize is None:
+                # Read CSVs
+                accident_df = _read_source(accidents_file, ACCIDENT_DTYPES)
+                vehicle_df = _read_source(vehicles_file, VEHICLE_DTYPES)
+
+                self._load_phases(accident_phases, accident_df, session)
+                self._load_phases(vehicle_phases, vehicle_df, session)
+
+                # Commit all changes
+                session.commit()
+            else:
+                # Accident chunks go first so every vehicle chunk can find its accidents in the database
+                for number, accident_df in enumerate(_read_source(accidents_file, ACCIDENT_DTYPES, chunksize), 1):
+                    print(f"Accident chunk {number} ({len(accident_df)} rows)")
+                    self._load_phases(accident_phases, accident_df, session, chunk=number)
+                    session.commit()
+
+                for number, vehicle_df in enumerate(_read_source(vehicles_file, VEHICLE_DTYPES, chunksize), 1):
+                    print(f"Vehicle chunk {number} ({len(vehicle_df)} rows)")
+                    self._load_phases(vehicle_phases, vehicle_df, session, chunk=number)
+                    session.commit()
+
+            # The run is complete, the next load of the same files starts from the beginning
+            if self.checkpoint:
+                session.execute(delete(LoadCheckpoint).where(LoadCheckpoint.run_key == self.run_key))
+                session.commit()
 
-            # Load all VehicleMake and VehicleModel records
-            print("Loading Vehicle Make/Model data...")
-            self._load_vehicle_makes_models(vehicle_df, session)
-
-            # Load all Accident records
-            print("Loading Accident data...")
-            self._load_accidents(accident_df, session)
-
-            # Load all Driver and Vehicle records
-            print("Loading Vehicle and Driver data...")
-            self._load_vehicles_drivers(vehicle_df, session)
-
-            # Commit all changes
-            session.commit()
             print("All data successfully loaded!")
 
         except Exception as e:
-            # Roll back in case of error
+            # Roll back in case of error - in chunked mode earlier chunks stay committed
             session.rollback()
             print(f"Error during data loading: {str(e)}")
             raise
         finally:
             session.close()
 
+    def _load_phases(self, phases, df, session, chunk=None):
+        for name, load_phase in phases:
+            step = f"{load_phase.__name__}:{chunk or 0}"
+            if step in self.completed_steps:
+                print(f"Skipping {name} data, already loaded")
+                continue
+
+            print(f"Loading {name} data...")
+            with self.metrics.stage(load_phase.__name__, loader='load_to_database', mode=self.mode, chunk=chunk):
+                self.metrics.add(rows_read=len(df))
+                load_phase(df, session)
+
+            # The checkpoint row commits in the same transaction as the phase's rows
+            if self.checkpoint:
+                session.add(LoadCheckpoint(run_key=self.run_key, step=step, completed_at=datetime.datetime.now()))
+                session.commit()
+
+    def _load_checkpoints(self, session, accidents_file, vehicles_file, chunksize):
+        # Steps an earlier, unfinished run of the same load already committed. The key changes with the
+        # files, mode or chunksize, as the chunk numbers only line up for the same inputs
+        run = f"{os.path.abspath(accidents_file)}|{os.path.abspath(vehicles_file)}|{self.mode}|{chunksize}"
+        self.run_key = hashlib.sha1(run.encode()).hexdigest()
+        self.completed_steps = set(session.scalars(
+            select(LoadCheckpoint.step).where(LoadCheckpoint.run_key == self.run_key)))
+        session.commit()
+        if self.completed_steps:
+            print(f"Resuming load, {len(self.completed_steps)} phases already committed")
+
+    def _load_key_maps(self, session):
+        # Seed the key maps with rows already in the database - one query per table, lowest id wins
+        # like the .first() lookups did. They are rebuilt on every load so ids from a rolled back
+        # chunk never survive into the next run
+        conn = session.connection()
+        self._reset_key_maps()
+
+        roads = pd.read_sql(select(Road.road_class, Road.road_number, Road.road_type, Road.speed_limit,
+                                   Road.road_id).order_by(Road.road_id), conn)
+        self._add_keys(self.road_ids, roads[['road_class', 'road_number']], roads['road_id'])
+        self._new_rows(roads, ['road_class', 'road_number', 'road_type', 'speed_limit'], self.loaded_roads)
+
+        junctions = pd.read_sql(select(Junction.junction_control, Junction.junction_detail,
+                                       Junction.junction_id).order_by(Junction.junction_id), conn)
+        self._add_keys(self.junction_ids, junctions[['junction_control', 'junction_detail']],
+                       junctions['junction_id'])
+
+        conditions = pd.read_sql(select(Condition.weather_conditions, Condition.road_surface_conditions,
+                                        Condition.light_conditions, Condition.special_conditions_at_site,
+                                        Condition.carriageway_hazards,
+                                        Condition.condition_id).order_by(Condition.condition_id), conn)
+        self._add_keys(self.condition_ids, conditions[['weather_conditions', 'road_surface_conditions',
+                                                       'light_conditions']], conditions['condition_id'])
+        self._new_rows(conditions, CONDITION_ATTRIBUTES, self.loaded_conditions)
+
+        # The default condition an earlier load created, so a rerun doesn't create another one
+        unknown = conditions[(conditions[CONDITION_ATTRIBUTES] == 'Unknown').all(axis=1)]
+        if len(unknown):
+            self.default_condition_id = int(unknown['condition_id'].iloc[0])
+
+        makes = pd.read_sql(select(VehicleMake.make_name, VehicleMake.make_id).order_by(VehicleMake.make_id), conn)
+        self._add_keys(self.make_ids, makes['make_name'], makes['make_id'])
+
+        models = pd.read_sql(select(VehicleModel.model_name,
+                                    VehicleModel.model_id).order_by(VehicleModel.model_id), conn)
+        self._add_keys(self.model_ids, models['model_name'], models['model_id'])
+
+        for frame in (roads, junctions, conditions, makes, models):
+            self.metrics.add_frame(frame)
+
+    def _reset_key_maps(self):
+        self.road_ids.clear()
+        self.junction_ids.clear()
+        self.condition_ids.clear()
+        self.make_ids.clear()
+        self.model_ids.clear()
+        self.default_condition_id = None
+        self.loaded_roads.clear()
+        self.loaded_conditions.clear()
+
+    @staticmethod
+    def _new_rows(frame, columns, seen):
+        # Keep the rows whose attributes weren't loaded yet (by an earlier chunk or an earlier run)
+        # and remember them, so de-duplication carries across chunks
+        keys = pd.Series(list(frame[columns].apply(key_column).itertuples(index=False, name=None)),
+                         index=frame.index, dtype=object)
+        is_new = ~keys.isin(seen) & ~keys.duplicated()
+        seen.update(keys[is_new])
+        return frame[is_new]
+
+    @staticmethod
+    def _add_keys(key_map, keys, ids):
+        # Keep the first id seen for each natural key
+        if isinstance(keys, pd.DataFrame):
+            key_values = keys.apply(key_column).itertuples(index=False, name=None)
+        else:
+            key_values = key_column(keys)
+        for key, new_id in zip(key_values, ids.tolist()):
+            key_map.setdefault(key, new_id)
+
+    @staticmethod
+    def _lookup_ids(keys, key_map):
+        # Vectorized join of natural key columns against a key map, returns the ids aligned to keys
+        if isinstance(keys, pd.Series):
+            return key_column(keys).map(key_map).astype('Int64')
+        columns = list(keys.columns)
+        lookup = pd.DataFrame(list(key_map), columns=columns, dtype=object)
+        lookup['_id'] = pd.array(list(key_map.values()), dtype='Int64')
+        matched = keys.apply(key_column).merge(lookup, on=columns, how='left')
+        return matched['_id'].set_axis(keys.index)
+
     def _load_locations(self, df, session):
-        # Load Location data row by row
+        # Load Location data row by row, the columns are converted up front by the column mapping
 
-        processed_locations = set()
-        count = 0
-        skipped = 0
+        # Skip rows with NaN in critical fields (latitude, longitude)
+        locations = df.dropna(subset=['Latitude', 'Longitude'])
+        skipped = len(df) - len(locations)
 
-        for _, row in df.iterrows():
-            # Skip rows with NaN in critical fields (latitude, longitude)
-            if pd.isna(row['Latitude']) or pd.isna(row['Longitude']):
-                skipped += 1
-                continue
+        # Locations an earlier run loaded count as processed
+        processed_locations = existing_keys(session, Location.location_key,
+                                            location_key(locations['Latitude'], locations['Longitude']))
+        count = 0
 
-            location_key = (row['Latitude'], row['Longitude'])
+        frame = map_columns(locations, LOCATION_COLUMNS)
+        frame.insert(2, 'location_key', location_key(frame['latitude'], frame['longitude']))
 
+        for record in frame_to_records(frame):
             # Skip if already processed
-            if location_key in processed_locations:
+            if record['location_key'] in processed_locations:
                 continue
 
             try:
-                # Create a new location object
-                location = Location(
-                    latitude=float(row['Latitude']),
-                    longitude=float(row['Longitude']),
-                    location_easting_OSGR=int(float(row['Location_Easting_OSGR'])) if not pd.isna(
-                        row['Location_Easting_OSGR']) else 0,
-                    location_northing_OSGR=int(float(row['Location_Northing_OSGR'])) if not pd.isna(
-                        row['Location_Northing_OSGR']) else 0,
-                    LSOA_of_accident_location=str(row['LSOA_of_Accident_Location']) if not pd.isna(
-                        row['LSOA_of_Accident_Location']) else 'Unknown',
-                    urban_or_rural_area=str(row['Urban_or_Rural_Area']) if not pd.isna(
-                        row['Urban_or_Rural_Area']) else 'Unknown',
-                    in_Scotland=str(row.get('InScotland', 'No')) if not pd.isna(row.get('InScotland')) else 'No',
-                    local_authority_district=str(row['Local_Authority_(District)']) if not pd.isna(
-                        row['Local_Authority_(District)']) else 'Unknown',
-                    local_authority_highway=str(row['Local_Authority_(Highway)']) if not pd.isna(
-                        row['Local_Authority_(Highway)']) else 'Unknown'
-                )
-
-                # Add one location at a time
-                session.add(location)
+                # Add one location at a time, a failing row only rolls back its own savepoint
+                with session.begin_nested():
+                    session.add(Location(**record))
                 count += 1
-                session.flush()
-                processed_locations.add(location_key)
+                processed_locations.add(record['location_key'])
 
             except Exception as e:
                 # Log the problematic row
-                print(f"Error processing location: Lat={row['Latitude']}, Long={row['Longitude']}")
+                print(f"Error processing location: Lat={record['latitude']}, Long={record['longitude']}")
                 print(f"Error details: {str(e)}")
-                session.rollback()
+                self._reject(Location.__table__, record, e)
 
         print(f"Successfully loaded {count} unique locations (skipped {skipped} incomplete records)")
+        self.metrics.add(rows_inserted=count, rows_skipped=skipped)
 
     def _load_roads(self, df, session):
-         # Get unique combinations of road attributes
+        # Get unique combinations of road attributes, skip rows with NaN in required fields
         road_attributes = df[['1st_Road_Class', '1st_Road_Number', 'Road_Type', 'Speed_limit']].drop_duplicates()
+        roads = road_attributes.dropna(subset=['1st_Road_Class', 'Road_Type'])
+        skipped = len(road_attributes) - len(roads)
 
         count = 0
-        skipped = 0
-
-        for _, row in road_attributes.iterrows():
-            # Skip rows with NaN in required fields
-            if pd.isna(row['1st_Road_Class']) or pd.isna(row['Road_Type']):
-                skipped += 1
-                continue
 
+        # Roads already loaded by an earlier run are skipped
+        frame = map_columns(roads, ROAD_COLUMNS)
+        frame = self._new_rows(frame, ['road_class', 'road_number', 'road_type', 'speed_limit'], self.loaded_roads)
+        for record in frame_to_records(frame):
             try:
-                # Handle NaN values for numeric fields
-                road_number = 0
-                if not pd.isna(row['1st_Road_Number']):
-                    road_number = int(float(row['1st_Road_Number']))
-
-                speed_limit = None
-                if not pd.isna(row['Speed_limit']):
-                    speed_limit = int(float(row['Speed_limit']))
-
-                # Create road object
-                road = Road(
-                    road_class=str(row['1st_Road_Class']),
-                    road_number=road_number,
-                    road_type=str(row['Road_Type']),
-                    speed_limit=speed_limit
-                )
-
-                session.add(road)
+                road = Road(**record)
+                with session.begin_nested():
+                    session.add(road)
                 count += 1
-                session.flush()
-
+                self.road_ids.setdefault((road.road_class, road.road_number), road.road_id)
 
             except Exception as e:
-                print(f"Error processing road: Class={row['1st_Road_Class']}, Number={row['1st_Road_Number']}")
+                print(f"Error processing road: Class={record['road_class']}, Number={record['road_number']}")
                 print(f"Error details: {str(e)}")
-                session.rollback()
+                self._reject(Road.__table__, record, e)
 
         print(f"Successfully loaded {count} unique roads (skipped {skipped} incomplete records)")
+        self.metrics.add(rows_inserted=count, rows_skipped=skipped)
 
     def _load_junctions(self, df, session):
         junction_attributes = df[['Junction_Control', 'Junction_Detail']].drop_duplicates()
 
         count = 0
 
-        for _, row in junction_attributes.iterrows():
-            junction = Junction(
-                junction_control=row['Junction_Control'],
-                junction_detail=row['Junction_Detail']
-            )
+        # The junction key map doubles as the set of junctions already loaded
+        frame = map_columns(junction_attributes, JUNCTION_COLUMNS)
+        frame = frame[self._lookup_ids(frame, self.junction_ids).isna()]
+        junctions = []
+        for record in frame_to_records(frame):
+            junction = Junction(**record)
             session.add(junction)
+            junctions.append(junction)
             count += 1
 
         session.flush()
+        for junction in junctions:
+            self.junction_ids.setdefault((junction.junction_control, junction.junction_detail),
+                                         junction.junction_id)
 
         print(f"Successfully loaded {count} unique junctions")
+        self.metrics.add(rows_inserted=count)
 
     def _load_conditions(self, df, session):
         """Load Condition data row by row with NaN handling"""
-        # Get unique combinations of condition attributes
+        # Get unique combinations of condition attributes, skip rows with NaN in required fields
         condition_attributes = df[['Weather_Conditions', 'Road_Surface_Conditions',
                                    'Light_Conditions', 'Special_Conditions_at_Site',
                                    'Carriageway_Hazards']].drop_duplicates()
+        conditions = condition_attributes.dropna(subset=['Weather_Conditions', 'Road_Surface_Conditions',
+                                                         'Light_Conditions', 'Special_Conditions_at_Site'])
+        skipped = len(condition_attributes) - len(conditions)
 
         count = 0
-        skipped = 0
-
-        for _, row in condition_attributes.iterrows():
-            # Skip rows with NaN in required fields
-            if (pd.isna(row['Weather_Conditions']) or
-                    pd.isna(row['Road_Surface_Conditions']) or
-                    pd.isna(row['Light_Conditions']) or
-                    pd.isna(row['Special_Conditions_at_Site'])):
-                skipped += 1
-                continue
 
+        # Conditions already loaded by an earlier run are skipped
+        frame = self._new_rows(map_columns(conditions, CONDITION_COLUMNS), CONDITION_ATTRIBUTES, self.loaded_conditions)
+        for record in frame_to_records(frame):
             try:
-                # Create condition object
-                condition = Condition(
-                    weather_conditions=str(row['Weather_Conditions']),
-                    road_surface_conditions=str(row['Road_Surface_Conditions']),
-                    light_conditions=str(row['Light_Conditions']),
-                    special_conditions_at_site=str(row['Special_Conditions_at_Site']),
-                    carriageway_hazards=str(row['Carriageway_Hazards']) if not pd.isna(
-                        row['Carriageway_Hazards']) else None
-                )
-
-                session.add(condition)
+                condition = Condition(**record)
+                with session.begin_nested():
+                    session.add(condition)
                 count += 1
-                session.flush()
-
+                self.condition_ids.setdefault((condition.weather_conditions, condition.road_surface_conditions,
+                                               condition.light_conditions), condition.condition_id)
 
             except Exception as e:
-
-                print(
-                    f"Error processing condition: Weather={row['Weather_Conditions']}, Surface={row['Road_Surface_Conditions']}")
+                print(f"Error processing condition: Weather={record['weather_conditions']}, "
+                      f"Surface={record['road_surface_conditions']}")
                 print(f"Error details: {str(e)}")
-                session.rollback()
+                self._reject(Condition.__table__, record, e)
 
         print(f"Successfully loaded {count} unique conditions (skipped {skipped} incomplete records)")
+        self.metrics.add(rows_inserted=count, rows_skipped=skipped)
 
     def _load_vehicle_makes_models(self, df, session):
-        # Get unique vehicle makes
-        make_series = df['make'].dropna().unique()
+        # Get unique vehicle makes, the ones already in the key maps were loaded by an earlier run
+        make_series = [name for name in df['make'].dropna().unique() if name not in self.make_ids]
 
         count_make = 0
         count_model = 0
 
+        makes = []
         for make_name in make_series:
             make = VehicleMake(make_name=make_name)
             session.add(make)
+            makes.append(make)
             count_make += 1
 
         # Get unique vehicle models
-        model_series = df['model'].dropna().unique()
+        model_series = [name for name in df['model'].dropna().unique() if name not in self.model_ids]
+        models = []
         for model_name in model_series:
             model = VehicleModel(model_name=model_name)
             session.add(model)
+            models.append(model)
             count_model += 1
 
 
         session.flush()
+        for make in makes:
+            self.make_ids.setdefault(make.make_name, make.make_id)
+        for model in models:
+            self.model_ids.setdefault(model.model_name, model.model_id)
         print(f"Successfully loaded {count_make} unique makes and {count_model} unique models")
+        self.metrics.add(rows_inserted=count_make + count_model)
 
     def _load_accidents(self, df, session):
+        # Skip rows with missing essential data, convert the remaining columns up front
+        accidents = df.dropna(subset=['Accident_Index', 'Latitude', 'Longitude', 'Date'])
+        skipped = len(df) - len(accidents)
         count = 0
-        skipped = 0
 
-        # Create a default condition if needed
-        default_condition = None
+        # Accidents an earlier run loaded are skipped
+        accident_index = str_column(accidents['Accident_Index'])
+        accidents = accidents[~accident_index.isin(existing_keys(session, Accident.accident_index, accident_index))]
 
-        for _, row in df.iterrows():
-            # Skip rows with missing essential data
-            if (pd.isna(row['Accident_Index']) or pd.isna(row['Latitude']) or
-                    pd.isna(row['Longitude']) or pd.isna(row['Date'])):
-                skipped += 1
-                continue
+        frame = map_columns(accidents, ACCIDENT_COLUMNS)
+        frame.insert(3, 'location_key', location_key(frame['latitude'], frame['longitude']))
+        records = frame_to_records(frame)
+        road_keys = map_columns(accidents, ROAD_KEY_COLUMNS).itertuples(index=False, name=None)
+        junction_keys = map_columns(accidents, JUNCTION_COLUMNS).itertuples(index=False, name=None)
+        condition_keys = map_columns(accidents, CONDITION_KEY_COLUMNS).itertuples(index=False, name=None)
+
+        accident_dates, accident_times = self._parse_date_time(accidents)
 
+        for record, road_key, junction_key, condition_key, accident_date, accident_time in zip(
+                records, road_keys, junction_keys, condition_keys, accident_dates, accident_times):
             try:
                 with session.no_autoflush:
-                    # Find related records
-                    road = None
-                    junction = None
-                    condition = None
-
-                    try:
-                        road = session.query(Road).filter_by(
-                            road_class=str(row['1st_Road_Class']),
-                            road_number=int(float(row['1st_Road_Number'])) if not pd.isna(row['1st_Road_Number']) else 0
-                        ).first()
-                    except Exception as e:
-                        print(f"Error finding road for accident {row['Accident_Index']}: {str(e)}")
-                        # Get any road as fallback
-                        road = session.query(Road).first()
-
-                    try:
-                        junction = session.query(Junction).filter_by(
-                            junction_control=str(row['Junction_Control']),
-                            junction_detail=str(row['Junction_Detail'])
-                        ).first()
-                    except Exception as e:
-                        print(f"Error finding junction for accident {row['Accident_Index']}: {str(e)}")
-                        # Get any junction as fallback
-                        junction = session.query(Junction).first()
-
-                    try:
-                        condition = session.query(Condition).filter_by(
-                            weather_conditions=str(row['Weather_Conditions']),
-                            road_surface_conditions=str(row['Road_Surface_Conditions']),
-                            light_conditions=str(row['Light_Conditions'])
-                        ).first()
-                    except Exception as e:
-                        print(f"Error finding condition for accident {row['Accident_Index']}: {str(e)}")
+                    # Find related records in the key maps
+                    road_id = self.road_ids.get(road_key)
+                    junction_id = self.junction_ids.get(junction_key)
+                    condition_id = self.condition_ids.get(condition_key)
 
                     # If no condition was found, create default one if it doesn't exist yet
-                    if condition is None:
-                        if default_condition is None:
-                            print("Creating default condition for missing conditions")
-                            default_condition = Condition(
-                                weather_conditions="Unknown",
-                                road_surface_conditions="Unknown",
-                                light_conditions="Unknown",
-                                special_conditions_at_site="Unknown",
-                                carriageway_hazards="Unknown"
-                            )
-                            session.add(default_condition)
-                            session.flush()  # Get ID for the default condition
-
-                        condition = default_condition
+                    if condition_id is None:
+                        condition_id = self._default_condition_id(session)
 
                     # If  couldn't find related records, skip this accident
-                    if not road or not junction or not condition:
-                        print(f"Skipping accident {row['Accident_Index']} due to missing related records")
+                    if road_id is None or junction_id is None:
+                        print(f"Skipping accident {record['accident_index']} due to missing related records")
+                        skipped += 1
+                        continue
+
+                    # Rows whose date can't be parsed can't be loaded either
+                    if accident_date is None:
                         skipped += 1
                         continue
 
-                    # Parse date and time
-                    accident_date = pd.to_datetime(row['Date']).date()
-
-                    # Handle time
-                    accident_time = datetime.time(0, 0)  # Default
-                    if 'Time' in row and not pd.isna(row['Time']):
-                        time_str = row['Time']
-                        try:
-                            accident_time = pd.to_datetime(time_str, format='%H:%M').time()
-                        except:
-                            try:
-                                accident_time = pd.to_datetime(time_str).time()
-                            except:
-                                print(f"Could not parse time: {time_str}")
-
-                    # Create accident with handling of NaN
                     accident = Accident(
-                        accident_index=str(row['Accident_Index']),
-                        latitude=float(row['Latitude']),
-                        longitude=float(row['Longitude']),
-                        road_id=road.road_id,
-                        junction_id=junction.junction_id,
-                        condition_id=condition.condition_id,
+                        road_id=road_id,
+                        junction_id=junction_id,
+                        condition_id=condition_id,
                         accident_date=accident_date,
                         accident_time=accident_time,
-                        police_attended=int(float(row['Did_Police_Officer_Attend_Scene_of_Accident'])) if not pd.isna(
-                            row.get('Did_Police_Officer_Attend_Scene_of_Accident')) else None,
-                        number_of_casualties=int(float(row.get('Number_of_Casualties', 0))) if not pd.isna(
-                            row.get('Number_of_Casualties')) else 0,
-                        number_of_vehicles=int(float(row.get('Number_of_Vehicles', 0))) if not pd.isna(
-                            row.get('Number_of_Vehicles')) else 0,
-                        pedestrian_crossing_human_control=int(
-                            float(row.get('Pedestrian_Crossing-Human_Control'))) if not pd.isna(
-                            row.get('Pedestrian_Crossing-Human_Control')) else None,
-                        pedestrian_crossing_physical_facilities=int(
-                            float(row.get('Pedestrian_Crossing-Physical_Facilities'))) if not pd.isna(
-                            row.get('Pedestrian_Crossing-Physical_Facilities')) else None,
-                        police_force=str(row.get('Police_Force')) if not pd.isna(row.get('Police_Force')) else None
+                        **record
                     )
 
-                    session.add(accident)
-                    session.flush()
+                    with session.begin_nested():
+                        session.add(accident)
                     count += 1
 
-
             except Exception as e:
-                print(f"Error processing accident {row['Accident_Index']}: {str(e)}")
-                session.rollback()
+                print(f"Error processing accident {record['accident_index']}: {str(e)}")
+                self._reject(Accident.__table__, record, e)
 
         print(f"Successfully loaded {count} accidents (skipped {skipped} incomplete records)")
+        self.metrics.add(rows_inserted=count, rows_skipped=skipped)
 
     def _load_vehicles_drivers(self, df, session):
+        # Skip rows with missing make/model or accident_index, convert the remaining columns up front
+        vehicles = df.dropna(subset=['make', 'model', 'Accident_Index'])
         count_driver = 0
         count_vehicle = 0
 
-        for _, row in df.iterrows():
-            try:
-                # Skip rows with missing make/model or accident_index
-                if pd.isna(row.get('make')) or pd.isna(row.get('model')) or pd.isna(row.get('Accident_Index')):
-                    continue
+        drivers = frame_to_records(map_columns(vehicles, DRIVER_COLUMNS))
+        records = frame_to_records(map_columns(vehicles, VEHICLE_COLUMNS))
+        makes = str_column(vehicles['make'])
+        models = str_column(vehicles['model'])
+        accident_keys = existing_keys(session, Accident.accident_index, str_column(vehicles['Accident_Index']))
+        loaded = self._loaded_vehicles(session, vehicles)
 
+        for driver_record, record, make_name, model_name in zip(drivers, records, makes, models):
+            try:
                 # Check if accident exists
-                accident_index = str(row['Accident_Index'])
+                accident_index = record['accident_index']
 
                 with session.no_autoflush:
-                    accident = session.get(Accident, accident_index)
-
-                    if not accident:
+                    if accident_index not in accident_keys:
                         print(f"Warning: No accident found for vehicle with Accident_Index {accident_index}")
                         continue
 
-                    # Create driver first with NaN handling
-                    driver = Driver(
-                        age_band_of_driver=str(row.get('Age_Band_of_Driver', 'Unknown')) if not pd.isna(
-                            row.get('Age_Band_of_Driver')) else 'Unknown',
-                        driver_home_area_type=str(row.get('Driver_Home_Area_Type', 'Unknown')) if not pd.isna(
-                            row.get('Driver_Home_Area_Type')) else 'Unknown',
-                        driver_IMD_decile=int(float(row.get('Driver_IMD_Decile'))) if not pd.isna(
-                            row.get('Driver_IMD_Decile')) else None,
-                        sex=str(row.get('Sex_of_Driver', 'Unknown')) if not pd.isna(
-                            row.get('Sex_of_Driver')) else 'Unknown',
-                        journey_purpose=str(row.get('Journey_Purpose_of_Driver', 'Unknown')) if not pd.isna(
-                            row.get('Journey_Purpose_of_Driver')) else 'Unknown'
-                    )
-                    session.add(driver)
-                    count_driver += 1
-                    session.flush()  # Need this to get the driver_id
-
-                    # Find the vehicle make
-                    make = session.query(VehicleMake).filter_by(
-                        make_name=str(row['make'])
-                    ).first()
-
-                    # Find the vehicle model
-                    model = session.query(VehicleModel).filter_by(
-                        model_name=str(row['model'])
-                    ).first()
-
-                    # Handle numeric values
-                    age_of_vehicle = int(float(row.get('Age_of_Vehicle'))) if not pd.isna(
-                        row.get('Age_of_Vehicle')) else None
-                    engine_capacity = int(float(row.get('Engine_Capacity_.CC.'))) if not pd.isna(
-                        row.get('Engine_Capacity_.CC.')) else None
-                    vehicle_location = int(float(row.get('Vehicle_Location.Restricted_Lane'))) if not pd.isna(
-                        row.get('Vehicle_Location.Restricted_Lane')) else None
-                    vehicle_reference = int(float(row.get('Vehicle_Reference', 0))) if not pd.isna(
-                        row.get('Vehicle_Reference')) else 0
-
-
-                    vehicle = Vehicle(
-                        accident_index=accident_index,
-                        make_id=make.make_id if make else None,
-                        model_id=model.model_id if model else None,
-                        driver_id=driver.driver_id,
-                        age_of_vehicle=age_of_vehicle,
-                        propulsion_code=str(row.get('Propulsion_Code')) if not pd.isna(
-                            row.get('Propulsion_Code')) else None,
-                        vehicle_type=str(row.get('Vehicle_Type', 'Unknown')) if not pd.isna(
-                            row.get('Vehicle_Type')) else 'Unknown',
-                        engine_capacity_CC=engine_capacity,
-                        skidding_and_overturning=str(row.get('Skidding_and_Overturning')) if not pd.isna(
-                            row.get('Skidding_and_Overturning')) else None,
-                        towing_and_articulation=str(row.get('Towing_and_Articulation', 'Unknown')) if not pd.isna(
-                            row.get('Towing_and_Articulation')) else 'Unknown',
-                        vehicle_leaving_carriageway=str(
-                            row.get('Vehicle_Leaving_Carriageway', 'Unknown')) if not pd.isna(
-                            row.get('Vehicle_Leaving_Carriageway')) else 'Unknown',
-                        vehicle_location_restricted_lane=vehicle_location,
-                        vehicle_manoeuvre=str(row.get('Vehicle_Manoeuvre', 'Unknown')) if not pd.isna(
-                            row.get('Vehicle_Manoeuvre')) else 'Unknown',
-                        vehicle_reference=vehicle_reference,
-                        vehicle_left_hand_drive=str(row.get('Was_Vehicle_Left_Hand_Drive', 'Unknown')) if not pd.isna(
-                            row.get('Was_Vehicle_Left_Hand_Drive')) else 'Unknown',
-                        first_point_of_impact=str(row.get('X1st_Point_of_Impact', 'Unknown')) if not pd.isna(
-                            row.get('X1st_Point_of_Impact')) else 'Unknown',
-                        hit_object_in_carriageway=str(row.get('Hit_Object_in_Carriageway')) if not pd.isna(
-                            row.get('Hit_Object_in_Carriageway')) else None,
-                        hit_object_off_carriageway=str(row.get('Hit_Object_off_Carriageway')) if not pd.isna(
-                            row.get('Hit_Object_off_Carriageway')) else None,
-                        vehicle_junction_location=str(row.get('Junction_Location', 'Unknown')) if not pd.isna(
-                            row.get('Junction_Location')) else 'Unknown'
-                    )
+                    # Vehicles a rerun or an earlier row already loaded are skipped
+                    vehicle_key = (accident_index, record['vehicle_reference'])
+                    if vehicle_key in loaded:
+                        continue
 
-                    session.add(vehicle)
+                    # Driver and vehicle share a savepoint, a failure rolls back both
+                    with session.begin_nested():
+                        # Create driver first
+                        driver = Driver(**driver_record)
+                        session.add(driver)
+                        session.flush()  # Need this to get the driver_id
+
+                        # Find the vehicle make and model
+                        vehicle = Vehicle(
+                            make_id=self.make_ids.get(make_name),
+                            model_id=self.model_ids.get(model_name),
+                            driver_id=driver.driver_id,
+                            **record
+                        )
+                        session.add(vehicle)
+
+                    loaded.add(vehicle_key)
+                    count_driver += 1
                     count_vehicle += 1
 
-                    session.flush()
+            except Exception as e:
+                print(f"Error processing vehicle for accident {record['accident_index']}: {str(e)}")
+                self._reject(Vehicle.__table__, record, e)
 
+        print(f"Successfully loaded {count_driver} drivers and {count_vehicle} vehicles")
+        self.metrics.add(rows_inserted=count_driver + count_vehicle, rows_skipped=len(df) - count_vehicle)
+
+    ################################
+    # Bulk load path - each table is cleaned as whole pandas columns and written in batches
+
+    def _insert_frame(self, session, table, frame):
+        # Write a frame in batches and return the rows that made it into the database, so the key maps
+        # and child rows never point at a rejected row
+        inserted = insert_batches(session, table, frame_to_records(frame), self.batch_size, self.on_reject)
+        if len(inserted) == len(frame):
+            return frame
+        return pd.DataFrame(inserted, columns=frame.columns)
+
+    def _next_id(self, session, id_column):
+        # Surrogate keys are handed out here so child rows can reference them without a read back
+        return session.scalar(select(func.coalesce(func.max(id_column), 0))) + 1
+
+    def _bulk_load_locations(self, df, session):
+        # Skip rows with NaN in critical fields (latitude, longitude), then keep one row per location key
+        # that isn't in the database yet
+        locations = df.dropna(subset=['Latitude', 'Longitude'])
+        skipped = len(df) - len(locations)
+        keys = location_key(locations['Latitude'], locations['Longitude'])
+        is_new = ~keys.duplicated() & ~keys.isin(existing_keys(session, Location.location_key, keys))
+
+        frame = map_columns(locations[is_new], LOCATION_COLUMNS)
+        frame.insert(2, 'location_key', keys[is_new])
+
+        count = len(self._insert_frame(session, Location.__table__, frame))
+        print(f"Successfully loaded {count} unique locations (skipped {skipped} incomplete records)")
+        self.metrics.add(rows_inserted=count, rows_skipped=skipped)
 
-            except Exception as e:
-                print(f"Error processing vehicle for accident {row.get('Accident_Index')}: {str(e)}")
-                session.rollback()
+    def _bulk_load_roads(self, df, session):
+        # Get unique combinations of road attributes, skip rows with NaN in required fields
+        road_attributes = df[['1st_Road_Class', '1st_Road_Number', 'Road_Type', 'Speed_limit']].drop_duplicates()
+        roads = road_attributes.dropna(subset=['1st_Road_Class', 'Road_Type'])
+        skipped = len(road_attributes) - len(roads)
 
+        frame = map_columns(roads, ROAD_COLUMNS)
+        frame = self._new_rows(frame, ['road_class', 'road_number', 'road_type', 'speed_limit'], self.loaded_roads)
+        first_id = self._next_id(session, Road.road_id)
+        frame.insert(0, 'road_id', np.arange(first_id, first_id + len(frame)))
+
+        frame = self._insert_frame(session, Road.__table__, frame)
+        count = len(frame)
+        self._add_keys(self.road_ids, frame[['road_class', 'road_number']], frame['road_id'])
+        print(f"Successfully loaded {count} unique roads (skipped {skipped} incomplete records)")
+        self.metrics.add(rows_inserted=count, rows_skipped=skipped)
+
+    def _bulk_load_junctions(self, df, session):
+        junction_attributes = df[['Junction_Control', 'Junction_Detail']].drop_duplicates()
+
+        # The junction key map doubles as the set of junctions already loaded
+        frame = map_columns(junction_attributes, JUNCTION_COLUMNS)
+        frame = frame[self._lookup_ids(frame, self.junction_ids).isna()]
+        first_id = self._next_id(session, Junction.junction_id)
+        frame.insert(0, 'junction_id', np.arange(first_id, first_id + len(frame)))
+
+        frame = self._insert_frame(session, Junction.__table__, frame)
+        count = len(frame)
+        self._add_keys(self.junction_ids, frame[['junction_control', 'junction_detail']], frame['junction_id'])
+        print(f"Successfully loaded {count} unique junctions")
+        self.metrics.add(rows_inserted=count)
+
+    def _bulk_load_conditions(self, df, session):
+        # Get unique combinations of condition attributes, skip rows with NaN in required fields
+        condition_attributes = df[['Weather_Conditions', 'Road_Surface_Conditions',
+                                   'Light_Conditions', 'Special_Conditions_at_Site',
+                                   'Carriageway_Hazards']].drop_duplicates()
+        conditions = condition_attributes.dropna(subset=['Weather_Conditions', 'Road_Surface_Conditions',
+                                                         'Light_Conditions', 'Special_Conditions_at_Site'])
+        skipped = len(condition_attributes) - len(conditions)
+
+        frame = map_columns(conditions, CONDITION_COLUMNS)
+        frame = self._new_rows(frame, CONDITION_ATTRIBUTES, self.loaded_conditions)
+        first_id = self._next_id(session, Condition.condition_id)
+        frame.insert(0, 'condition_id', np.arange(first_id, first_id + len(frame)))
+
+        frame = self._insert_frame(session, Condition.__table__, frame)
+        count = len(frame)
+        self._add_keys(self.condition_ids, frame[['weather_conditions', 'road_surface_conditions',
+                                                  'light_conditions']], frame['condition_id'])
+        print(f"Successfully loaded {count} unique conditions (skipped {skipped} incomplete records)")
+        self.metrics.add(rows_inserted=count, rows_skipped=skipped)
+
+    def _bulk_load_vehicle_makes_models(self, df, session):
+        # Makes and models already in the key maps were loaded by an earlier chunk
+        make_names = [name for name in df['make'].dropna().unique() if name not in self.make_ids]
+        first_make_id = self._next_id(session, VehicleMake.make_id)
+        makes = pd.DataFrame({
+            'make_id': np.arange(first_make_id, first_make_id + len(make_names)),
+            'make_name': make_names
+        })
+
+        model_names = [name for name in df['model'].dropna().unique() if name not in self.model_ids]
+        first_model_id = self._next_id(session, VehicleModel.model_id)
+        models = pd.DataFrame({
+            'model_id': np.arange(first_model_id, first_model_id + len(model_names)),
+            'model_name': model_names
+        })
+
+        makes = self._insert_frame(session, VehicleMake.__table__, makes)
+        models = self._insert_frame(session, VehicleModel.__table__, models)
+        self._add_keys(self.make_ids, makes['make_name'], makes['make_id'])
+        self._add_keys(self.model_ids, models['model_name'], models['model_id'])
+        print(f"Successfully loaded {len(makes)} unique makes and {len(models)} unique models")
+        self.metrics.add(rows_inserted=len(makes) + len(models))
+
+    def _parse_date_time(self, accidents):
+        # Date and Time parsed for the whole frame, unparseable dates become NaT and unparseable
+        # times midnight. Both are counted in the stage metrics
+        accident_date = _parse_column(accidents['Date'], DATE_FORMAT, self.parsed_dates)
+        accident_time = _parse_column(accidents['Time'], TIME_FORMAT, self.parsed_times)
+
+        unparsed_dates = int((accident_date.isna() & accidents['Date'].notna()).sum())
+        unparsed_times = int((accident_time.isna() & accidents['Time'].notna()).sum())
+        if unparsed_dates or unparsed_times:
+            print(f"Could not parse {unparsed_dates} dates and {unparsed_times} times")
+        self.metrics.add(unparsed_dates=unparsed_dates, unparsed_times=unparsed_times)
+
+        accident_date = accident_date.dt.date.where(accident_date.notna(), None)
+        accident_time = accident_time.dt.time.where(accident_time.notna(), datetime.time(0, 0))
+        return accident_date, accident_time
+
+    def _default_condition_id(self, session):
+        # Condition used for accidents whose conditions can't be matched, created once
+        if self.default_condition_id is None:
+            print("Creating default condition for missing conditions")
+            default_condition = Condition(
+                weather_conditions="Unknown",
+                road_surface_conditions="Unknown",
+                light_conditions="Unknown",
+                special_conditions_at_site="Unknown",
+                carriageway_hazards="Unknown"
+            )
+            session.add(default_condition)
+            session.flush()  # Get ID for the default condition
+            self.default_condition_id = default_condition.condition_id
+        return self.default_condition_id
+
+    def _bulk_load_accidents(self, df, session):
+        # Skip rows with missing essential data
+        accidents = df.dropna(subset=['Accident_Index', 'Latitude', 'Longitude', 'Date'])
+        skipped = len(df) - len(accidents)
+        accidents = accidents.drop_duplicates(subset=['Accident_Index'])
+        accident_index = str_column(accidents['Accident_Index'])
+        accidents = accidents[~accident_index.isin(existing_keys(session, Accident.accident_index, accident_index))]
+
+        # Resolve the foreign keys against the key maps for the whole frame at once
+        road_id = self._lookup_ids(map_columns(accidents, ROAD_KEY_COLUMNS), self.road_ids)
+        junction_id = self._lookup_ids(map_columns(accidents, JUNCTION_COLUMNS), self.junction_ids)
+        condition_id = self._lookup_ids(map_columns(accidents, CONDITION_KEY_COLUMNS), self.condition_ids)
+
+        # If no condition was found, use the default one for all misses
+        if condition_id.isna().any():
+            condition_id = condition_id.fillna(self._default_condition_id(session))
+
+        # If couldn't find related records, skip those accidents
+        resolved = road_id.notna() & junction_id.notna()
+        skipped += int((~resolved).sum())
+        accidents = accidents[resolved]
+
+        accident_date, accident_time = self._parse_date_time(accidents)
+
+        # Rows whose date can't be parsed can't be loaded either
+        has_date = accident_date.notna()
+        skipped += int((~has_date).sum())
+
+        frame = map_columns(accidents, ACCIDENT_COLUMNS)
+        frame.insert(3, 'location_key', location_key(frame['latitude'], frame['longitude']))
+        frame.insert(4, 'road_id', road_id[resolved])
+        frame.insert(5, 'junction_id', junction_id[resolved])
+        frame.insert(6, 'condition_id', condition_id[resolved])
+        frame.insert(7, 'accident_date', accident_date)
+        frame.insert(8, 'accident_time', accident_time)
+        frame = frame[has_date]
+
+        count = len(self._insert_frame(session, Accident.__table__, frame))
+        print(f"Successfully loaded {count} accidents (skipped {skipped} incomplete records)")
+        self.metrics.add(rows_inserted=count, rows_skipped=skipped)
+
+    @staticmethod
+    def _vehicle_keys(vehicles):
+        # (accident_index, vehicle_reference) of each vehicle row, converted like the Vehicle columns
+        keys = map_columns(vehicles, VEHICLE_KEY_COLUMNS)
+        return pd.Series(list(keys.apply(key_column).itertuples(index=False, name=None)),
+                         index=vehicles.index, dtype=object)
+
+    @staticmethod
+    def _loaded_vehicles(session, vehicles):
+        # Keys of the vehicles already in the database for the accidents of the chunk
+        return existing_keys(session, Vehicle.accident_index, str_column(vehicles['Accident_Index']),
+                             [Vehicle.vehicle_reference])
+
+    def _bulk_load_vehicles_drivers(self, df, session):
+        # Skip rows with missing make/model or accident_index
+        vehicles = df.dropna(subset=['make', 'model', 'Accident_Index'])
+        accident_index = str_column(vehicles['Accident_Index'])
+
+        # Check the chunk's accidents exist in the database
+        has_accident = accident_index.isin(existing_keys(session, Accident.accident_index, accident_index))
+        if not has_accident.all():
+            print(f"Warning: No accident found for {int((~has_accident).sum())} vehicles")
+        vehicles = vehicles[has_accident]
+
+        # A vehicle is keyed on its accident and its reference within the accident, vehicles an earlier run
+        # or chunk loaded are skipped together with their drivers, so a rerun doesn't insert them again
+        keys = self._vehicle_keys(vehicles)
+        is_new = ~keys.duplicated() & ~keys.isin(self._loaded_vehicles(session, vehicles))
+        if not is_new.all():
+            print(f"Skipping {int((~is_new).sum())} vehicles that are already loaded")
+        vehicles = vehicles[is_new]
+
+        # Driver ids are assigned here so each vehicle can point at its driver
+        first_driver_id = self._next_id(session, Driver.driver_id)
+        drivers = map_columns(vehicles, DRIVER_COLUMNS)
+        drivers.insert(0, 'driver_id', np.arange(first_driver_id, first_driver_id + len(vehicles)))
+
+        frame = map_columns(vehicles, VEHICLE_COLUMNS)
+        frame.insert(1, 'make_id', self._lookup_ids(str_column(vehicles['make']), self.make_ids))
+        frame.insert(2, 'model_id', self._lookup_ids(str_column(vehicles['model']), self.model_ids))
+        frame.insert(3, 'driver_id', drivers['driver_id'])
+
+        # A vehicle whose driver was rejected has nothing to point at and is skipped with it
+        inserted_drivers = self._insert_frame(session, Driver.__table__, drivers)
+        count_driver = len(inserted_drivers)
+        if count_driver < len(drivers):
+            frame = frame[frame['driver_id'].isin(inserted_drivers['driver_id'])]
+        count_vehicle = len(self._insert_frame(session, Vehicle.__table__, frame))
         print(f"Successfully loaded {count_driver} drivers and {count_vehicle} vehicles")
+        self.metrics.add(rows_inserted=count_driver + count_vehicle, rows_skipped=len(df) - count_vehicle)
 
 ################################
 # Run it all here!
 
-accident_file = 'ProjectDataFiles/Accidents_extract.csv'
-vehicle_file = 'ProjectDataFiles/Vehicles_extract.csv'
+if __name__ == '__main__':
+    accident_file = 'ProjectDataFiles/Accidents_extract.parquet'
+    vehicle_file = 'ProjectDataFiles/Vehicles_extract.parquet'
 
-# Initialize data loader
-loader = TrafficAccidentDataLoader(conn_string_db)
+    # Initialize data loader, a rerun after a failure picks up from the last committed phase
+    loader = TrafficAccidentDataLoader(conn_string_db, checkpoint=True)
 
-# Load data
-loader.load_data(accident_file, vehicle_file)
+    # Load data
+    loader.load_data(accident_file, vehicle_file)
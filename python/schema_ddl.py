@@ -0,0 +1,195 @@
+import argparse
+from sqlalchemy import Index, BigInteger, text, inspect, update, func, cast
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateTable, CreateIndex, CreateColumn
+
+from dw_aggregates import AGGREGATES
+from etl_utils import MICRODEGREES, LONGITUDE_BITS
+
+# DDL for the OLTP and warehouse schemas, generated from the ORM models in the two loaders plus the
+# index plan below. Every column the loaders look rows up by or join on gets an index: the natural keys
+# of the dimensions are unique (they are what merge_Dimension de-duplicates on), except in the dimensions
+# with Type 2 history, which keep several versions per key and index it together with is_current. The fact
+# foreign keys are plain indexes, and on SQL Server the facts can also get a nonclustered columnstore index.
+#
+#   python schema_ddl.py dw --dialect mssql --columnstore > dw_schema.sql
+
+# table -> [(columns, unique)]
+OLTP_INDEXES = {
+    'Location': [(['location_key'], True)],
+    'Road': [(['road_class', 'road_number'], False)],
+    'Junction': [(['junction_control', 'junction_detail'], False)],
+    'Condition': [(['weather_conditions', 'road_surface_conditions', 'light_conditions'], False)],
+    'VehicleMake': [(['make_name'], True)],
+    'VehicleModel': [(['model_name'], True)],
+    'Accident': [
+        (['latitude', 'longitude'], False),
+        (['location_key'], False),
+        (['road_id'], False),
+        (['junction_id'], False),
+        (['condition_id'], False),
+        (['accident_date'], False)
+    ],
+    'Vehicle': [
+        (['accident_index'], False),
+        (['make_id'], False),
+        (['model_id'], False),
+        (['driver_id'], False)
+    ]
+}
+
+DW_INDEXES = {
+    'DimDate': [(['date'], True)],
+    'DimLocation': [(['location_key', 'is_current'], False)],
+    'DimCondition': [(['src_condition_id'], True)],
+    'DimRoad': [(['src_road_id', 'junction_control', 'junction_detail', 'is_current'], False)],
+    'DimAccidentDetail': [(['accident_index'], True)],
+    'DimDriver': [(['src_driver_id', 'is_current'], False)],
+    'DimVehicleDetail': [(['src_vehicle_id', 'is_current'], False)],
+    'FactAccident': [
+        (['accident_detail_id'], False),
+        (['date_key'], False),
+        (['road_id'], False),
+        (['condition_id'], False),
+        (['location_id'], False),
+        (['accident_date'], False)
+    ],
+    'FactVehicle': [
+        (['accident_detail_id'], False),
+        (['driver_id'], False),
+        (['vehicle_detail_id'], False)
+    ],
+    # One row per grain in each summary table, the refreshes match their new rows on it
+    **{name: [(grain, True)] for name, (fact, grain) in AGGREGATES.items()}
+}
+
+# Fact tables that get a columnstore index when asked for, SQL Server only
+COLUMNSTORE_TABLES = ['FactAccident', 'FactVehicle']
+
+
+def location_key_sql(table):
+    # etl_utils.location_key computed by the database from the table's latitude and longitude
+    latitude = cast(func.round(table.c.latitude * MICRODEGREES, 0), BigInteger) + 90 * MICRODEGREES
+    longitude = cast(func.round(table.c.longitude * MICRODEGREES, 0), BigInteger) + 180 * MICRODEGREES
+    return latitude * 2 ** LONGITUDE_BITS + longitude
+
+
+# Columns later versions of the loaders added to existing tables: table -> {column: value for the rows
+# already there, as a function of the table}. Versioned dimension rows become the current version from
+# the migration on, their row_hash is filled in by the next merge
+VERSION_BACKFILL = {'effective_from': lambda table: func.current_timestamp(), 'is_current': lambda table: 1}
+
+BACKFILLS = {
+    'Location': {'location_key': location_key_sql},
+    'Accident': {'location_key': location_key_sql},
+    'DimLocation': {'location_key': location_key_sql, **VERSION_BACKFILL},
+    **{name: VERSION_BACKFILL for name in ['DimRoad', 'DimDriver', 'DimVehicleDetail']}
+}
+
+
+def plan_indexes(metadata, plan):
+    # Attach the planned indexes to the tables in metadata, so create_all and CreateTable pick them up.
+    # Indexes that are already attached are left alone, so this can run more than once
+    indexes = []
+    for table_name, table_indexes in plan.items():
+        table = metadata.tables[table_name]
+        existing = {index.name: index for index in table.indexes}
+        for columns, unique in table_indexes:
+            name = f"{'ux' if unique else 'ix'}_{table_name}_{'_'.join(columns)}"
+            if name not in existing:
+                existing[name] = Index(name, *[table.c[column] for column in columns], unique=unique)
+            indexes.append(existing[name])
+    return indexes
+
+
+def columnstore_ddl(table):
+    # Nonclustered, so the primary key stays the clustered index the loaders insert through
+    columns = ', '.join(f'[{column.name}]' for column in table.columns)
+    return (f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ncci_{table.name}') "
+            f"CREATE NONCLUSTERED COLUMNSTORE INDEX ncci_{table.name} ON {table.name} ({columns})")
+
+
+def schema_ddl(metadata, plan, dialect_name, columnstore=False):
+    # CREATE TABLE and CREATE INDEX statements for every table, in dependency order
+    dialect = make_url(f'{dialect_name}://').get_dialect()()
+    plan_indexes(metadata, plan)
+    statements = []
+    for table in metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(dialect=dialect)).strip())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            statements.append(str(CreateIndex(index).compile(dialect=dialect)).strip())
+        if columnstore and dialect_name == 'mssql' and table.name in COLUMNSTORE_TABLES:
+            statements.append(columnstore_ddl(table))
+    return statements
+
+
+def add_columns(conn, metadata):
+    # ALTER TABLE ... ADD the model columns an existing table doesn't have yet and fill them in for its
+    # rows from BACKFILLS, so tables created by an older version of the loaders keep working. The table's
+    # stg_ copy (emptied after every merge) still has the old columns, it is dropped and the next load
+    # creates it again
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        added = [column for column in table.columns if column.name not in existing]
+        for column in added:
+            conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} "
+                              f"ADD {CreateColumn(column).compile(dialect=conn.dialect)}"))
+            backfill = BACKFILLS.get(table.name, {}).get(column.name)
+            if backfill is not None:
+                conn.execute(update(table).values({column.name: backfill(table)}))
+        if added and inspector.has_table('stg_' + table.name):
+            conn.execute(text(f"DROP TABLE {preparer.quote('stg_' + table.name)}"))
+
+
+def drop_stale_indexes(conn, plan, indexes):
+    # Indexes an older index plan created that the current one doesn't have, such as the unique natural
+    # key of a dimension that now keeps several versions per key
+    planned = {index.name for index in indexes}
+    inspector = inspect(conn)
+    for table_name in plan:
+        if not inspector.has_table(table_name):
+            continue
+        for index in inspector.get_indexes(table_name):
+            name = index['name']
+            if name.startswith((f'ux_{table_name}_', f'ix_{table_name}_')) and name not in planned:
+                conn.execute(text(f"DROP INDEX {name} ON {table_name}" if conn.dialect.name == 'mssql'
+                                  else f"DROP INDEX {name}"))
+
+
+def create_schema(engine, metadata, plan, columnstore=False):
+    # Create missing tables, columns and indexes. create_all only creates whole tables, so columns added
+    # to the models since an existing table was created are added (and backfilled) here, and the planned
+    # indexes are created one by one
+    indexes = plan_indexes(metadata, plan)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        add_columns(conn, metadata)
+        drop_stale_indexes(conn, plan, indexes)
+        for index in indexes:
+            index.create(conn, checkfirst=True)
+        if columnstore and engine.dialect.name == 'mssql':
+            for table_name in COLUMNSTORE_TABLES:
+                if table_name in metadata.tables:
+                    conn.execute(text(columnstore_ddl(metadata.tables[table_name])))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the DDL of the OLTP or warehouse schema')
+    parser.add_argument('schema', choices=['oltp', 'dw'])
+    parser.add_argument('--dialect', default='mssql', help='SQLAlchemy dialect name, e.g. mssql or sqlite')
+    parser.add_argument('--columnstore', action='store_true', help='add columnstore indexes on the facts (mssql)')
+    args = parser.parse_args()
+
+    if args.schema == 'oltp':
+        from load_to_database import Base
+        plan = OLTP_INDEXES
+    else:
+        from load_to_data_warehouse import Base
+        plan = DW_INDEXES
+
+    for statement in schema_ddl(Base.metadata, plan, args.dialect, args.columnstore):
+        print(statement + ';\n')
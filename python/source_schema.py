@@ -0,0 +1,75 @@
+# Dtypes for every column of the Kaggle Accident_Information and Vehicle_Information files.
+# Low-cardinality text is categorical, codes and counts are nullable small ints (so NaN survives
+# without falling back to float64). Latitude/Longitude stay float64: float32 only holds ~7 significant
+# digits, which would change the 6-decimal coordinates the Location key is matched on
+
+ACCIDENT_SCHEMA = {
+    'Accident_Index': 'object',
+    '1st_Road_Class': 'category',
+    '1st_Road_Number': 'Int16',
+    '2nd_Road_Class': 'category',
+    '2nd_Road_Number': 'Int16',
+    'Accident_Severity': 'category',
+    'Carriageway_Hazards': 'category',
+    'Date': 'category',
+    'Day_of_Week': 'category',
+    'Did_Police_Officer_Attend_Scene_of_Accident': 'Int8',
+    'Junction_Control': 'category',
+    'Junction_Detail': 'category',
+    'Latitude': 'float64',
+    'Light_Conditions': 'category',
+    'Local_Authority_(District)': 'category',
+    'Local_Authority_(Highway)': 'category',
+    'Location_Easting_OSGR': 'Int32',
+    'Location_Northing_OSGR': 'Int32',
+    'Longitude': 'float64',
+    'LSOA_of_Accident_Location': 'category',
+    'Number_of_Casualties': 'Int16',
+    'Number_of_Vehicles': 'Int16',
+    'Pedestrian_Crossing-Human_Control': 'Int8',
+    'Pedestrian_Crossing-Physical_Facilities': 'Int8',
+    'Police_Force': 'category',
+    'Road_Surface_Conditions': 'category',
+    'Road_Type': 'category',
+    'Special_Conditions_at_Site': 'category',
+    'Speed_limit': 'Int16',
+    'Time': 'category',
+    'Urban_or_Rural_Area': 'category',
+    'Weather_Conditions': 'category',
+    'Year': 'Int16',
+    'InScotland': 'category'
+}
+
+VEHICLE_SCHEMA = {
+    'Accident_Index': 'object',
+    'Age_Band_of_Driver': 'category',
+    'Age_of_Vehicle': 'Int16',
+    'Driver_Home_Area_Type': 'category',
+    'Driver_IMD_Decile': 'Int8',
+    'Engine_Capacity_.CC.': 'Int32',
+    'Hit_Object_in_Carriageway': 'category',
+    'Hit_Object_off_Carriageway': 'category',
+    'Journey_Purpose_of_Driver': 'category',
+    'Junction_Location': 'category',
+    'make': 'category',
+    'model': 'category',
+    'Propulsion_Code': 'category',
+    'Sex_of_Driver': 'category',
+    'Skidding_and_Overturning': 'category',
+    'Towing_and_Articulation': 'category',
+    'Vehicle_Leaving_Carriageway': 'category',
+    'Vehicle_Location.Restricted_Lane': 'Int8',
+    'Vehicle_Manoeuvre': 'category',
+    'Vehicle_Reference': 'Int16',
+    'Vehicle_Type': 'category',
+    'Was_Vehicle_Left_Hand_Drive': 'category',
+    'X1st_Point_of_Impact': 'category',
+    'Year': 'Int16'
+}
+
+
+def source_dtypes(schema, columns=None):
+    # Dtypes for a subset of a file's columns, for readers that only project some of them
+    if columns is None:
+        return dict(schema)
+    return {column: schema[column] for column in columns}
@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, String, Float, create_engine, insert, select, func
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import load_to_database as oltp
+import load_to_data_warehouse as dw
+from etl_utils import location_key
+from schema_ddl import create_schema, OLTP_INDEXES, DW_INDEXES
+
+# An older warehouse has DimLocation as the first version of the loaders created it, keyed on
+# latitude/longitude and without location_key or the Type 2 columns. After create_schema migrates it,
+# reloading the same source locations must not add any rows
+
+LOCATIONS = [
+    {'latitude': 51.507351, 'longitude': -0.127758, 'location_easting_OSGR': 530047,
+     'location_northing_OSGR': 180422, 'LSOA_of_accident_location': 'E01004736', 'urban_or_rural_area': '1',
+     'in_Scotland': 'No', 'local_authority_district': 'Westminster', 'local_authority_highway': 'E09000033'},
+    {'latitude': 55.953251, 'longitude': -3.188267, 'location_easting_OSGR': 325916,
+     'location_northing_OSGR': 673956, 'LSOA_of_accident_location': None, 'urban_or_rural_area': '1',
+     'in_Scotland': 'Yes', 'local_authority_district': 'Edinburgh', 'local_authority_highway': 'S12000036'},
+    {'latitude': 53.480759, 'longitude': -2.242631, 'location_easting_OSGR': 383979,
+     'location_northing_OSGR': 398197, 'LSOA_of_accident_location': 'E01033677', 'urban_or_rural_area': '2',
+     'in_Scotland': 'No', 'local_authority_district': 'Manchester', 'local_authority_highway': 'E08000003'}
+]
+KEYS = location_key(pd.Series([row['latitude'] for row in LOCATIONS]),
+                    pd.Series([row['longitude'] for row in LOCATIONS])).astype(int).tolist()
+
+
+def old_DimLocation(metadata):
+    return Table(
+        'DimLocation', metadata,
+        Column('location_id', Integer, primary_key=True, autoincrement=True),
+        Column('location_easting_OSGR', Integer),
+        Column('location_northing_OSGR', Integer),
+        Column('LSOA', String),
+        Column('latitude', Float),
+        Column('longitude', Float),
+        Column('urban_rural_area', String),
+        Column('local_authority_district', String),
+        Column('local_authority_highway', String),
+        Column('in_Scotland', String)
+    )
+
+
+def test_migrated_DimLocation_keeps_its_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conStrdb = f"sqlite:///{tmp_path / 'oltp.db'}"
+    conStrdw = f"sqlite:///{tmp_path / 'dw.db'}"
+
+    engine_db = create_engine(conStrdb)
+    create_schema(engine_db, oltp.Base.metadata, OLTP_INDEXES)
+    with engine_db.begin() as conn:
+        conn.execute(insert(oltp.Location), [
+            {**row, 'location_key': key} for row, key in zip(LOCATIONS, KEYS)
+        ])
+    engine_db.dispose()
+
+    engine_dw = create_engine(conStrdw)
+    dim = old_DimLocation(MetaData())
+    dim.metadata.create_all(engine_dw)
+    with engine_dw.begin() as conn:
+        conn.execute(insert(dim), [{
+            'location_easting_OSGR': row['location_easting_OSGR'],
+            'location_northing_OSGR': row['location_northing_OSGR'],
+            'LSOA': row['LSOA_of_accident_location'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'urban_rural_area': row['urban_or_rural_area'],
+            'local_authority_district': row['local_authority_district'],
+            'local_authority_highway': row['local_authority_highway'],
+            'in_Scotland': row['in_Scotland']
+        } for row in LOCATIONS])
+
+    create_schema(engine_dw, dw.Base.metadata, DW_INDEXES)
+    with engine_dw.connect() as conn:
+        keys = conn.execute(select(dw.DimLocation.location_key, dw.DimLocation.is_current)).all()
+    assert sorted(keys) == sorted((key, 1) for key in KEYS)
+    engine_dw.dispose()
+
+    with dw.ETLContext(conStrdb, conStrdw, incremental=False, checkpoint=False, aggregates=False) as ctx:
+        dw.pipe_Location(ctx)
+        with ctx.engine_dw.connect() as conn:
+            assert conn.scalar(select(func.count()).select_from(dw.DimLocation)) == len(LOCATIONS)
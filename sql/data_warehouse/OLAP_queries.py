@@ -1,10 +1,16 @@
 import pandas as pd
 import tabulate as tbl
 import urllib
+import os
+import sys
 
 # Note sqlalchemy instead of pyodbc
 from sqlalchemy import create_engine
 
+# The grouped queries go through the aggregate router shared with the warehouse loader in ../../python
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'python'))
+from dw_aggregates import route_query
+
 # define connection string
 conn_str = "Driver={ODBC Driver 17 for SQL Server};Server=andy-neil-forem\\SQLEXPRESS;"
 conn_str = conn_str + "Database=Term_Project_Traffic_Accidents_OLAP_DW;Trusted_Connection=yes;"
@@ -13,6 +19,9 @@ conn_str = "mssql+pyodbc:///?odbc_connect=%s" % conn_str
 
 engine = create_engine(conn_str)
 
+# Column names of the routed queries in the report
+REPORT_LABELS = {'urban_rural_area': 'Area Type', 'fact_count': 'Accident Count'}
+
 # Test connection
 with engine.connect() as connection:
     print("Connected to SQL Server successfully!")
@@ -50,37 +59,26 @@ def main():
     )
     #print_query_results(query2)
 
+    # Queries 3-5 are routed to the smallest summary table that has their columns (AggAccidentYearArea,
+    # AggVehicleMakeModel), or to the facts while the summary tables aren't refreshed up to the last load
+
     # 3 - Rollup - Find total accident count for urban and rural areas. Exclude unallocated area
-    query3 = (
-        "SELECT COALESCE(dl.urban_rural_area, 'All areas') AS 'Area Type', "
-	    "COUNT(*) AS 'Accident Count' "
-        "FROM FactAccident fa JOIN DimLocation dl ON fa.location_id = dl.location_id "
-        "GROUP BY ROLLUP (dl.urban_rural_area) "
-        "HAVING dl.urban_rural_area != 'Unallocated';"
-    )
+    # (the last row, with no area, is the total)
+    query3 = route_query(engine, 'FactAccident', ['urban_rural_area'],
+                         where=[('urban_rural_area', '!=', 'Unallocated')], rollup=True, labels=REPORT_LABELS,
+                         rollup_label='All areas')
     #print_query_results(query3)
 
     # 4 - Drilldown - Find total accident count for urban and rural areas, but now more detailed: for each year
     # Exclude unallocated area
-    query4 = (
-        "SELECT dd.year, dl.urban_rural_area AS 'Area Type', "
-	    "COUNT(*) AS 'Accident Count' "
-        "FROM FactAccident fa JOIN DimLocation dl ON fa.location_id = dl.location_id "
-        "JOIN DimDate dd on fa.date_key = dd.date_key "
-        "GROUP BY dd.year, dl.urban_rural_area "
-        "HAVING dl.urban_rural_area != 'Unallocated' "
-        "ORDER BY year, dl.urban_rural_area; "
-    )
+    query4 = route_query(engine, 'FactAccident', ['year', 'urban_rural_area'],
+                         where=[('urban_rural_area', '!=', 'Unallocated')], order_by=['year', 'urban_rural_area'],
+                         labels=REPORT_LABELS)
     #print_query_results(query4)
 
     # 5 - Top N - Find the top 10 makes/models of cars in accidents
-    query5 = (
-        "SELECT TOP 10 dvd.make_name, dvd.model_name, COUNT(*) AS 'Accident Count' "
-        "FROM FactVehicle fv JOIN DimAccidentDetail dad ON fv.accident_detail_id = dad.accident_detail_id "
-        "JOIN DimVehicleDetail dvd ON fv.vehicle_detail_id = dvd.vehicle_detail_id "
-        "GROUP BY dvd.make_name, dvd.model_name "
-        "ORDER BY COUNT(*) DESC;"
-    )
+    query5 = route_query(engine, 'FactVehicle', ['make_name', 'model_name'], order_by=['fact_count'],
+                         descending=True, limit=10, labels=REPORT_LABELS)
     print_query_results(query5)
 
 
@@ -73,11 +73,11 @@ def main():
     query5 = (
         "SELECT a.accident_index, a.number_of_vehicles, l.latitude, l.longitude "
         "FROM Accident a "
-        "JOIN Location l ON a.latitude = l.latitude AND a.longitude = l.longitude "
+        "JOIN Location l ON a.location_key = l.location_key "
         "WHERE a.number_of_vehicles > "
         "(SELECT AVG(a2.number_of_vehicles) "
         "FROM Accident a2 "
-        "JOIN Location l2 ON a2.latitude = l2.latitude AND a2.longitude = l2.longitude "
+        "JOIN Location l2 ON a2.location_key = l2.location_key "
         "WHERE l2.in_Scotland = 'Yes') "
         "AND l.in_Scotland = 'Yes' "
         "ORDER BY a.number_of_vehicles DESC;"